@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,13 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def local_cache():
+    """Тот же LocMemCache, что у manage.py test (core.test_runner)."""
+    from django.test.utils import override_settings
+    from core.test_runner import TEST_CACHES
+
+    with override_settings(CACHES=TEST_CACHES):
+        yield
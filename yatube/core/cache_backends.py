@@ -0,0 +1,246 @@
+"""Кэш в локальном файле SQLite, общий для всех процессов сервера.
+
+LocMemCache у каждого воркера gunicorn/uwsgi свой: при росте числа
+воркеров падает доля попаданий, а инвалидация (см. posts.cache) не
+доходит до соседних процессов. Этот бэкенд хранит записи в одном файле
+на хосте и не требует сетевого сервиса:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+Файл открывается в режиме WAL: читатели не блокируют писателя.
+Вытеснение — приблизительный LRU: время доступа обновляется не чаще
+раза в ACCESS_RESOLUTION секунд, чтобы каждое чтение не становилось
+записью. Целые числа хранятся как INTEGER, поэтому incr атомарен между
+процессами. Числа за пределами 64 бит SQLite не вмещает: они, как и
+прочие значения, сериализуются pickle.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+'''
+
+NOT_EXPIRED = '(expires IS NULL OR expires > ?)'
+# Диапазон INTEGER в SQLite.
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class SQLiteCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        options = params.get('OPTIONS', {})
+        self.access_resolution = options.get('ACCESS_RESOLUTION', 10)
+        # Проверять размер таблицы на каждой записи дорого: делаем это
+        # в среднем раз в CULL_CHECK_EVERY вставок.
+        self.cull_check_every = options.get('CULL_CHECK_EVERY', 100)
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединение своё у каждого потока и у каждого процесса:
+        # после fork наследованное соединение использовать нельзя.
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _write(self, sql, params=()):
+        return self._db.execute(sql, params).rowcount
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int and INT_MIN <= value <= INT_MAX:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _touch_rows(self, rows, now):
+        stale = [key for key, _, accessed in rows
+                 if now - accessed > self.access_resolution]
+        if stale:
+            self._db.execute(
+                'UPDATE cache SET accessed = ? WHERE key IN '
+                f'({",".join("?" * len(stale))})', [now, *stale])
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, accessed FROM cache '
+            f'WHERE key IN ({",".join("?" * len(keys))}) '
+            f'AND {NOT_EXPIRED}', [*keys, now]).fetchall()
+        self._touch_rows(rows, now)
+        return {keys[key]: self._load(value) for key, value, _ in rows}
+
+    def _set_rows(self, items, timeout):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        with self._transaction():
+            self._db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                [(key, self._dump(value), expires, now)
+                 for key, value in items])
+        if random.random() * self.cull_check_every < len(items):
+            self._cull(now)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_rows([(self._key(key, version), value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_rows(
+            [(self._key(key, version), value) for key, value in data.items()],
+            timeout)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction():
+            self._write(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+            added = self._write(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (key, self._dump(value), self.get_backend_timeout(timeout),
+                 now))
+        return bool(added)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return bool(self._write(
+            'UPDATE cache SET expires = ?, accessed = ? '
+            f'WHERE key = ? AND {NOT_EXPIRED}',
+            (self.get_backend_timeout(timeout), now, key, now)))
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction():
+            # При переполнении SQLite превратил бы сумму в REAL: такой
+            # инкремент, как и инкремент большого числа, считаем в Python.
+            updated = self._write(
+                'UPDATE cache SET value = value + ?, accessed = ? '
+                "WHERE key = ? AND typeof(value) = 'integer' "
+                f'AND value + ? BETWEEN ? AND ? AND {NOT_EXPIRED}',
+                (delta, now, key, delta, INT_MIN, INT_MAX, now))
+            if updated:
+                return self._db.execute(
+                    'SELECT value FROM cache WHERE key = ?',
+                    (key,)).fetchone()[0]
+            row = self._db.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {NOT_EXPIRED}',
+                (key, now)).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._load(row[0]) + delta
+            self._write('UPDATE cache SET value = ?, accessed = ? '
+                        'WHERE key = ?', (self._dump(value), now, key))
+            return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {NOT_EXPIRED}',
+            (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self._write('DELETE FROM cache WHERE key = ?',
+                    (self._key(key, version),))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            placeholders = ','.join('?' * len(keys))
+            self._write(
+                f'DELETE FROM cache WHERE key IN ({placeholders})', keys)
+
+    def clear(self):
+        self._write('DELETE FROM cache')
+
+    def _cull(self, now):
+        with self._transaction():
+            self._write('DELETE FROM cache WHERE expires <= ?', (now,))
+            count = self._db.execute('SELECT COUNT(*) FROM cache').fetchone()
+            if count[0] <= self._max_entries:
+                return
+            # Как и встроенные бэкенды: при переполнении удаляем
+            # 1/CULL_FREQUENCY записей, самые давно читанные.
+            if self._cull_frequency == 0:
+                self._write('DELETE FROM cache')
+                return
+            self._write(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)',
+                (count[0] // self._cull_frequency,))
+
+    def close(self, **kwargs):
+        # Соединение живёт весь срок жизни потока; закрывать его после
+        # каждого запроса (как делает Django) значило бы платить за
+        # открытие файла и PRAGMA на каждом запросе.
+        pass
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: сразу берём блокировку на запись,
+    чтобы параллельные процессы ждали busy_timeout, а не получали
+    ошибку при повышении блокировки посреди транзакции."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
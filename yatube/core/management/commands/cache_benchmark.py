@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+from time import perf_counter
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache_backends import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку get/set у LocMemCache, FileBasedCache '
+            'и SQLiteCache на значениях размера карточки и страницы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000)
+        parser.add_argument('--keys', type=int, default=500)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        params = {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}}
+        backends = {
+            'LocMemCache': LocMemCache('benchmark', params),
+            'FileBasedCache': FileBasedCache(
+                os.path.join(directory, 'files'), params),
+            'SQLiteCache': SQLiteCache(
+                os.path.join(directory, 'cache.sqlite3'), params),
+        }
+        payloads = {'1 КБ': 'x' * 1024, '30 КБ': 'x' * 30 * 1024}
+        self.stdout.write(
+            f'{"бэкенд":<16} {"значение":>9} {"set, мкс":>10} '
+            f'{"get, мкс":>10} {"get_many(10), мкс":>18}')
+        try:
+            for name, backend in backends.items():
+                for size, payload in payloads.items():
+                    self.stdout.write(
+                        f'{name:<16} {size:>9} '
+                        + self.measure(backend, payload, options))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def measure(self, backend, payload, options):
+        ops, keys = options['ops'], options['keys']
+        backend.clear()
+        started = perf_counter()
+        for i in range(ops):
+            backend.set(f'key{i % keys}', payload)
+        set_us = (perf_counter() - started) * 1e6 / ops
+        started = perf_counter()
+        for i in range(ops):
+            backend.get(f'key{i % keys}')
+        get_us = (perf_counter() - started) * 1e6 / ops
+        batches = [[f'key{(i + j) % keys}' for j in range(10)]
+                   for i in range(0, ops, 10)]
+        started = perf_counter()
+        for batch in batches:
+            backend.get_many(batch)
+        many_us = (perf_counter() - started) * 1e6 / len(batches)
+        return f'{set_us:>10.1f} {get_us:>10.1f} {many_us:>18.1f}'
@@ -0,0 +1,153 @@
+"""Отдача файлов из MEDIA_ROOT вне режима DEBUG.
+
+django.views.static годится только для разработки: ни Range, ни
+нормальных условных запросов. Эта вьюха проверяет путь (только файлы
+внутри MEDIA_ROOT из каталогов MEDIA_SERVE_PREFIXES, без скрытых), сама
+отвечает на If-None-Match/If-Modified-Since и дальше:
+
+* при MEDIA_SENDFILE = 'x-accel-redirect' отдаёт файл nginx через
+  internal-location MEDIA_ACCEL_REDIRECT_PREFIX;
+* при MEDIA_SENDFILE = 'x-sendfile' — Apache (mod_xsendfile) или
+  lighttpd по абсолютному пути;
+* иначе стримит файл сама: целиком через FileResponse (wsgi.file_wrapper
+  у gunicorn/uwsgi — это sendfile), а запрошенный диапазон байт — кусками
+  по FileResponse.block_size.
+
+Имена картинок и миниатюр содержат хэш, поэтому файл под одним именем не
+меняется и кэшируется браузером надолго (MEDIA_CACHE_MAX_AGE).
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _resolve(path):
+    path = posixpath.normpath(path).lstrip('/')
+    parts = path.split('/')
+    if any(part.startswith('.') for part in parts) or not any(
+            path.startswith(prefix)
+            for prefix in settings.MEDIA_SERVE_PREFIXES):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    return path, full_path
+
+
+def parse_range(header, size):
+    """(начало, конец включительно) единственного диапазона из Range.
+
+    None — заголовка нет, он непонятен или диапазонов несколько: тогда
+    отдаём файл целиком, как разрешает RFC 7233. ValueError — диапазон
+    за концом файла (416).
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N — последние N байт.
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def _read(file, start, length, block_size=FileResponse.block_size):
+    with file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(block_size, length))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+
+
+def _stream(request, full_path, size, etag, last_modified):
+    header = request.META.get('HTTP_RANGE', '')
+    byte_range = None
+    if header and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        return FileResponse(open(full_path, 'rb'))
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        _read(open(full_path, 'rb'), start, end - start + 1), status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+    return response
+
+
+def _hand_off(path, full_path):
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+    else:
+        response['X-Sendfile'] = full_path
+    # Тип файла выставит сервер.
+    del response['Content-Type']
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    path, full_path = _resolve(path)
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    # Сильный ETag, как у nginx: по нему работает If-Range.
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.MEDIA_SENDFILE:
+            response = _hand_off(path, full_path)
+        else:
+            response = _stream(
+                request, full_path, stat.st_size, etag, last_modified)
+            content_type = mimetypes.guess_type(full_path)[0]
+            response['Content-Type'] = (
+                content_type or 'application/octet-stream')
+            response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(
+        response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
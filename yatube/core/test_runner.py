@@ -0,0 +1,26 @@
+"""Тест-раннер проекта: тесты работают с LocMemCache.
+
+Тесты зовут cache.clear(), а файл core.cache_backends.SQLiteCache общий
+для хоста: с ним они стёрли бы кэш сервера, работающего рядом. pytest
+подменяет кэш так же — фикстурой в tests/conftest.py.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class LocalCacheRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = override_settings(CACHES=TEST_CACHES)
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
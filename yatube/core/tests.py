@@ -1,4 +1,10 @@
-from django.test import TestCase, Client
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, Client, override_settings
+
+from core.cache_backends import SQLiteCache
 
 
 class ViewTestClass(TestCase):
@@ -10,3 +16,142 @@ class ViewTestClass(TestCase):
         response = self.guest_client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class SQLiteCacheTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_CHECK_EVERY': 1}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_get_set_delete(self):
+        self.cache.set('page', {'html': '<p>пост</p>'})
+        self.assertEqual(self.cache.get('page'), {'html': '<p>пост</p>'})
+        self.assertEqual(self.cache.get_many(['page', 'missing']),
+                         {'page': {'html': '<p>пост</p>'}})
+        self.cache.delete('page')
+        self.assertIsNone(self.cache.get('page'))
+
+    def test_add_incr_and_expiry(self):
+        self.assertTrue(self.cache.add('version', 1))
+        self.assertFalse(self.cache.add('version', 5))
+        self.assertEqual(self.cache.incr('version'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('short', 'value', timeout=0)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 'again'))
+
+    def test_integers_beyond_64_bits(self):
+        self.cache.set('big', 2 ** 70)
+        self.assertEqual(self.cache.get('big'), 2 ** 70)
+        self.assertEqual(self.cache.incr('big'), 2 ** 70 + 1)
+        self.cache.set('edge', 2 ** 63 - 1)
+        self.assertEqual(self.cache.incr('edge'), 2 ** 63)
+        self.assertEqual(self.cache.get('edge'), 2 ** 63)
+
+    def test_least_recently_used_entries_are_culled(self):
+        for i in range(10):
+            self.cache.set(f'key{i}', i)
+        with self.cache._transaction():
+            self.cache._write("UPDATE cache SET accessed = 0 "
+                              "WHERE key LIKE '%key0'")
+        self.cache.set('key10', 10)
+        self.assertIsNone(self.cache.get('key0'))
+        self.assertEqual(self.cache.get('key10'), 10)
+
+    def test_processes_share_entries(self):
+        other = SQLiteCache(self.cache.path, {})
+        self.cache.set('shared', 'value')
+        self.assertEqual(other.get('shared'), 'value')
+
+
+class MediaServeTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, 'posts', 'ab'))
+        with open(os.path.join(self.media_root, 'posts', 'ab',
+                               'image.gif'), 'wb') as file:
+            file.write(b'0123456789')
+        with open(os.path.join(self.media_root, 'secret.txt'), 'w') as file:
+            file.write('secret')
+        self.url = '/media/posts/ab/image.gif'
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_ranges(self):
+        cases = {
+            'bytes=2-5': (b'2345', 'bytes 2-5/10'),
+            'bytes=7-': (b'789', 'bytes 7-9/10'),
+            'bytes=-3': (b'789', 'bytes 7-9/10'),
+            'bytes=8-100': (b'89', 'bytes 8-9/10'),
+        }
+        for header, (content, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(self.content(response), content)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(
+                    int(response['Content-Length']), len(content))
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-30')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,4-5')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_access_is_checked(self):
+        for url in ('/media/secret.txt', '/media/posts/../secret.txt',
+                    '/media/posts/%2e%2e/secret.txt', '/media/posts/ab/',
+                    '/media/posts/.hidden', '/media/posts/missing.gif'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/posts/ab/image.gif')
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response.has_header('ETag'))
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(
+            self.media_root, 'posts', 'ab', 'image.gif'))
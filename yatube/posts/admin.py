@@ -1,20 +1,106 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 
-from .models import Follow, Post, Group, Comment
+from . import counters, search
+from .models import Counter, Follow, Post, Group, Comment
+from .paginator import EstimatedCountPaginator
+
+
+class GroupAutocomplete(AutocompleteSelect):
+    """Автодополнение группы в строке списка постов. Подпись выбранной
+    группы берётся из groups — групп, загруженных вместе с постами
+    страницы, — а не отдельным запросом на строку."""
+    groups = {}
+
+    def optgroups(self, name, value, attr=None):
+        selected = [pk for pk in map(str, value) if pk]
+        if any(pk not in self.groups for pk in selected):
+            return super().optgroups(name, value, attr)
+        options = [self.create_option(name, '', '', False, 0)]
+        options += [self.create_option(name, pk, str(self.groups[pk]),
+                                       True, 1) for pk in selected]
+        return [(None, options, 0)]
+
+
+class PostRowForm(forms.ModelForm):
+    """Строка списка постов: отдаёт виджету группу, которая уже пришла
+    с постом через list_select_related."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if Post.group.field.is_cached(self.instance):
+            group = self.instance.group
+            self.fields['group'].widget.groups = (
+                {str(group.pk): group} if group else {})
 
 
 class PostAdmin(admin.ModelAdmin):
     # Перечисляем поля, которые должны отображаться в админке
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
-    # Добавляем интерфейс для поиска по тексту постов
+    # Автор и группа приходят в том же запросе, что и посты
+    list_select_related = ('author', 'group')
+    # Добавляем интерфейс для поиска по тексту постов; ищет полнотекстовый
+    # индекс (см. get_search_results), заодно по группе и автору
     search_fields = ('text',)
     # Добавляем возможность фильтрации по дате
     list_filter = ('pub_date',)
     list_editable = ('group',)
     empty_value_display = '-пусто-'
+    # В форме поста автор и группа ищутся по мере ввода, а не
+    # перечисляются в <select> целиком
+    autocomplete_fields = ('author', 'group')
+    # Число постов берём из счётчиков, а не из COUNT(*) по всей таблице
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page,
+                      orphans=0, allow_empty_first_page=True):
+        count = None
+        if not queryset.query.where:
+            count = counters.get_count(Counter.TOTAL_POSTS)
+        return self.paginator(queryset, per_page, orphans,
+                              allow_empty_first_page, count=count)
+
+    def get_search_results(self, request, queryset, search_term):
+        return search.filter_posts(queryset, search_term), False
+
+    def get_changelist_form(self, request, **kwargs):
+        return super().get_changelist_form(
+            request, form=PostRowForm, **kwargs)
+
+    def get_changelist_formset(self, request, **kwargs):
+        # В строках списка — автодополнение без ссылок «добавить» и
+        # «изменить»: в HTML строки только выбранная группа, а не все
+        # группы сайта, и запросов к базе оно не добавляет.
+        formset = super().get_changelist_formset(request, **kwargs)
+        field = formset.form.base_fields['group']
+        field.widget = GroupAutocomplete(field.widget.rel, self.admin_site)
+        field.widget.choices = field.choices
+        return formset
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug')
+    # По этим полям ищет автодополнение группы в форме поста
+    search_fields = ('title', 'slug')
+    ordering = ('title',)
+
+
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    # Пост ищется через полнотекстовый поиск PostAdmin
+    autocomplete_fields = ('author', 'post')
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
-admin.site.register(Follow)
-admin.site.register(Comment)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(Follow, FollowAdmin)
+admin.site.register(Comment, CommentAdmin)
@@ -0,0 +1,239 @@
+"""Версионированный кэш страниц лент.
+
+Страница кэшируется под ключом, в который входит версия её «области»:
+feed для главной, group:<slug> для страницы группы, author:<username>
+для профиля, post:<id> для страницы поста (по ней строятся только
+валидаторы условных GET, см. posts.conditional). Сигналы
+(posts.signals) увеличивают версию при изменении постов, групп,
+подписок и комментариев, и следующая же выдача строится заново,
+поэтому кэшировать можно надолго. Старые записи никто не удаляет —
+они просто больше не читаются и вытесняются бэкендом.
+
+Сами страницы кладёт и достаёт cache_page_coalesced — замена cache_page
+с теми же ключами, но защищённая от «стада»: пересчитывает страницу один
+воркер, остальные ждут его или отдают прежнюю копию. Истёкшая страница
+ещё stale секунд отдаётся как есть, а новая строится в фоновом потоке
+(stale-while-revalidate).
+
+В общий кэш попадают только страницы анонимов. Шапка, кнопка подписки и
+ссылки на ленту подписок у каждого вошедшего свои, а ключ страницы
+выучивается до того, как SessionMiddleware добавит Vary: Cookie, — общая
+копия досталась бы всем. Браузеру кэш не виден: срок жизни страницы
+в заголовки не попадает, свежесть проверяют ETag и Last-Modified
+(posts.conditional).
+"""
+import copy
+import hashlib
+import math
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.cache import (get_cache_key, get_max_age, has_vary_header,
+                                learn_cache_key)
+
+FEED = 'feed'
+
+
+def _version_key(scope):
+    digest = hashlib.md5(scope.encode()).hexdigest()
+    return f'posts.version.{digest}'
+
+
+def _changed_key(scope):
+    digest = hashlib.md5(scope.encode()).hexdigest()
+    return f'posts.changed.{digest}'
+
+
+def _initial_version():
+    # Если ключ версии вытеснили, новая версия не должна совпасть со
+    # старой, иначе оживут устаревшие страницы.
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = {_version_key(scope): scope for scope in scopes}
+    versions = cache.get_many(list(keys))
+    for key in keys.keys() - versions.keys():
+        cache.add(key, _initial_version(), None)
+        versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def get_changed(scopes):
+    """Время последнего изменения любой из областей (timestamp).
+
+    Если отметку вытеснили, считаем, что область изменилась сейчас:
+    лишний полный ответ лучше ложного 304.
+    """
+    keys = [_changed_key(scope) for scope in scopes]
+    changed = cache.get_many(keys)
+    now = time.time()
+    for key in set(keys) - changed.keys():
+        cache.add(key, now, None)
+        changed[key] = cache.get(key, now)
+    return max(changed.values())
+
+
+def bump(*scopes):
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+    now = time.time()
+    cache.set_many({_changed_key(scope): now for scope in scopes}, None)
+
+
+def _should_refresh_early(expires, delta, beta):
+    """Вероятностное досрочное обновление (XFetch): чем ближе срок
+    и дороже пересчёт, тем вероятнее, что запрос обновит запись заранее,
+    и к моменту истечения кто-то один её уже перестроил."""
+    return time.time() - delta * beta * math.log(random.random()) >= expires
+
+
+def _shared(request):
+    """Страницу можно брать из общего кэша и класть в него: запрос
+    анонимный."""
+    user = getattr(request, 'user', None)
+    return user is None or not user.is_authenticated
+
+
+def _cacheable(request, response):
+    if response.streaming or response.status_code != 200:
+        return False
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def _lock_key(request, key_prefix):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'posts.lock.{key_prefix}.{url}'
+
+
+def cache_page_coalesced(timeout, key_prefix='', stale=0):
+    """Как cache_page, но без «стада» при промахе.
+
+    Запись хранится как (ответ, срок, время пересчёта). Промах берёт
+    блокировку через cache.add: пересчитывает тот, кто её получил,
+    остальные до FEED_CACHE_WAIT секунд ждут готовую страницу, а если
+    у них есть прежняя копия (досрочное обновление), сразу отдают её.
+    Не дождавшись, воркер считает страницу сам — лучше лишний рендер,
+    чем зависший запрос.
+
+    Запись живёт в кэше timeout + stale секунд. Запрос к истёкшей, но
+    ещё не выброшенной странице сразу получает её, а взявший блокировку
+    перестраивает страницу в фоновом потоке.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not _shared(request):
+                return view(request, *args, **kwargs)
+            entry = _lookup(request, key_prefix)
+            if entry is not None and not _should_refresh_early(
+                    entry[1], entry[2], settings.FEED_CACHE_BETA):
+                return entry[0]
+            lock_key = _lock_key(request, key_prefix)
+            locked = cache.add(lock_key, 1, settings.FEED_CACHE_LOCK_TIMEOUT)
+            if entry is not None and time.time() >= entry[1]:
+                if locked:
+                    _revalidate_in_background(
+                        request, view, args, kwargs,
+                        (timeout, stale, key_prefix), lock_key)
+                return entry[0]
+            if not locked:
+                entry = entry or _wait_for_entry(request, key_prefix)
+                if entry is not None:
+                    return entry[0]
+            try:
+                return _render_and_store(
+                    request, view, args, kwargs, (timeout, stale, key_prefix))
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+        return wrapper
+    return decorator
+
+
+def _lookup(request, key_prefix):
+    cache_key = get_cache_key(request, key_prefix, 'GET', cache)
+    return cache.get(cache_key) if cache_key else None
+
+
+def _wait_for_entry(request, key_prefix):
+    deadline = time.monotonic() + settings.FEED_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = _lookup(request, key_prefix)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _render_and_store(request, view, args, kwargs, options):
+    timeout, stale, key_prefix = options
+    started = time.monotonic()
+    response = view(request, *args, **kwargs)
+    if not _cacheable(request, response):
+        return response
+    max_age = get_max_age(response)
+    if max_age is not None:
+        timeout = max_age
+    if not timeout:
+        return response
+    delta = time.monotonic() - started
+    cache_key = learn_cache_key(request, response, timeout + stale,
+                                key_prefix, cache=cache)
+    cache.set(cache_key, (response, time.time() + timeout, delta),
+              timeout + stale)
+    return response
+
+
+def _revalidate_in_background(request, view, args, kwargs, options,
+                              lock_key):
+    # Копия запроса: исходный ещё дорабатывают middleware основного
+    # потока (CSRF, сессии пишут в META и атрибуты).
+    request = copy.copy(request)
+    request.META = request.META.copy()
+
+    def revalidate():
+        try:
+            _render_and_store(request, view, args, kwargs, options)
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    thread = threading.Thread(target=revalidate, daemon=True)
+    thread.start()
+    return thread
+
+
+def cache_feed_page(scope=FEED):
+    """Кэширует ответ вьюхи до смены версии области scope.
+
+    scope — строка формата, в которую подставляются аргументы вьюхи,
+    например 'group:{slug}'. Вошедшим пользователям страница рендерится
+    заново.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _shared(request):
+                return view(request, *args, **kwargs)
+            name = scope.format(**kwargs)
+            version = get_versions([name])[name]
+            key_prefix = f'{_version_key(name)}.{version}'
+            cached_view = cache_page_coalesced(
+                settings.FEED_CACHE_TIMEOUT, key_prefix=key_prefix,
+                stale=settings.FEED_CACHE_STALE)(view)
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,100 @@
+"""Условные GET (ETag / Last-Modified) для лент и страницы поста.
+
+Валидаторы собираются из тех же версий областей, что и кэш страниц
+(posts.cache): сигналы увеличивают версию и ставят отметку времени при
+любом изменении постов, групп, подписок и комментариев. Поэтому ответить
+304 можно, не рендеря страницу и почти не трогая базу. По свежей
+pub_date этого не сделать: правка и удаление поста её не сдвигают.
+
+В ETag входит и пользователь: шапка, кнопка подписки и форма
+комментария у каждого свои. У вошедшего к областям страницы добавляется
+его собственная user:<id>, которую сдвигают его подписки и отписки.
+ETag слабый — токен CSRF в форме меняется от рендера к рендеру,
+а содержимое страницы при этом то же. Но сам секрет CSRF (его cookie)
+в ETag входит: после нового входа он другой, и страница с формой
+со старым токеном не должна достаться браузеру по 304.
+
+Ответы помечаются Cache-Control: private, no-cache: браузер хранит
+страницу, но каждый раз сверяет её с сервером, а общие прокси её не
+кэшируют.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import cache
+from .models import Post
+
+
+def _validators(request, get_scopes, kwargs):
+    # condition() спрашивает ETag и Last-Modified по отдельности;
+    # запоминаем пару на запросе, чтобы не ходить в кэш и базу дважды.
+    if not hasattr(request, '_page_validators'):
+        request._page_validators = (None, None)
+        scopes = get_scopes(**kwargs)
+        if scopes and request.user.is_authenticated:
+            scopes = [*scopes, user_scope(request.user.pk)]
+        if scopes:
+            versions = cache.get_versions(scopes)
+            raw = repr((sorted(versions.items()), request.user.pk,
+                        request.COOKIES.get(settings.CSRF_COOKIE_NAME)))
+            etag = 'W/"%s"' % hashlib.md5(raw.encode()).hexdigest()
+            changed = datetime.fromtimestamp(
+                cache.get_changed(scopes), timezone.utc)
+            request._page_validators = (etag, changed)
+    return request._page_validators
+
+
+def conditional_page(get_scopes):
+    """Отвечает 304, если страница не менялась с прошлого запроса.
+
+    get_scopes(**kwargs) возвращает области страницы по аргументам вьюхи
+    или None, если страницы нет (тогда валидаторов нет и вьюха сама
+    ответит 404).
+    """
+    def etag(request, *args, **kwargs):
+        return _validators(request, get_scopes, kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return _validators(request, get_scopes, kwargs)[1]
+
+    def decorator(view):
+        view = condition(etag_func=etag, last_modified_func=last_modified)(
+            view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            patch_cache_control(
+                response, private=True, no_cache=True, max_age=0)
+            return response
+        return wrapper
+    return decorator
+
+
+def user_scope(user_id):
+    """Область того, что на страницах видит только сам пользователь."""
+    return f'user:{user_id}'
+
+
+def feed_scopes(scope=cache.FEED):
+    """Области страницы ленты: строка формата, как у cache_feed_page."""
+    def scopes(**kwargs):
+        return [scope.format(**kwargs)]
+    return scopes
+
+
+def post_scopes(post_id):
+    owners = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'group__slug').first()
+    if owners is None:
+        return None
+    username, slug = owners
+    scopes = [f'post:{post_id}', f'author:{username}']
+    if slug:
+        scopes.append(f'group:{slug}')
+    return scopes
@@ -0,0 +1,79 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Comment, Counter, Follow, Post
+
+# Как посчитать каждый счётчик честным запросом: по ним инициализируется
+# отсутствующая строка и пересобирается таблица командой rebuild_counters.
+SOURCES = {
+    Counter.AUTHOR_POSTS: (Post, 'author'),
+    Counter.GROUP_POSTS: (Post, 'group'),
+    Counter.POST_COMMENTS: (Comment, 'post'),
+    Counter.AUTHOR_FOLLOWERS: (Follow, 'author'),
+}
+
+
+def compute(kind, object_id=0):
+    """Значение счётчика по исходной таблице."""
+    if kind == Counter.TOTAL_POSTS:
+        return Post.objects.count()
+    model, field = SOURCES[kind]
+    return model.objects.filter(**{f'{field}_id': object_id}).count()
+
+
+def _create(kind, object_id):
+    value = compute(kind, object_id)
+    try:
+        with transaction.atomic():
+            Counter.objects.create(kind=kind, object_id=object_id,
+                                   value=value)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос.
+        return Counter.objects.get(kind=kind, object_id=object_id).value
+    return value
+
+
+def get_count(kind, object_id=0):
+    value = Counter.objects.filter(
+        kind=kind, object_id=object_id).values_list('value', flat=True)
+    value = value.first()
+    if value is None:
+        return _create(kind, object_id)
+    return value
+
+
+def get_total(kind, object_ids):
+    """Сумма счётчиков нескольких объектов, например постов всех авторов
+    из подписок."""
+    object_ids = set(object_ids)
+    rows = dict(Counter.objects.filter(
+        kind=kind, object_id__in=object_ids).values_list(
+            'object_id', 'value'))
+    for object_id in object_ids - rows.keys():
+        rows[object_id] = _create(kind, object_id)
+    return sum(rows.values())
+
+
+def change(kind, object_id=0, delta=1):
+    """Атомарно сдвигает счётчик. Если строки ещё нет, она считается
+    заново — изменение, ради которого нас позвали, уже в базе."""
+    updated = Counter.objects.filter(
+        kind=kind, object_id=object_id).update(value=F('value') + delta)
+    if not updated:
+        _create(kind, object_id)
+
+
+def rebuild():
+    """Пересчитывает все счётчики с нуля."""
+    counters = [Counter(kind=Counter.TOTAL_POSTS, object_id=0,
+                        value=Post.objects.count())]
+    for kind, (model, field) in SOURCES.items():
+        rows = (model.objects.filter(**{f'{field}__isnull': False})
+                .values(field).annotate(total=Count('pk')).order_by())
+        counters.extend(
+            Counter(kind=kind, object_id=row[field], value=row['total'])
+            for row in rows)
+    with transaction.atomic():
+        Counter.objects.all().delete()
+        Counter.objects.bulk_create(counters, batch_size=500)
+    return len(counters)
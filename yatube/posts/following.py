@@ -0,0 +1,88 @@
+"""Кэш подписок пользователей в памяти процесса.
+
+Для каждого пользователя хранится отсортированный массив id авторов,
+на которых он подписан: это в разы компактнее set из int, а проверка
+«подписан ли» — бинарный поиск. Кэш ограничен FOLLOWING_CACHE_SIZE
+пользователями и вытесняет давно не читавшихся (LRU).
+
+Запись помнит версию подписок пользователя из общего кэша (posts.cache,
+область following:<id>). Сигналы Follow увеличивают версию, и каждый
+процесс при следующем чтении видит, что его копия устарела. Запись
+живёт не дольше FOLLOWING_CACHE_TIMEOUT секунд — на случай, если версию
+вытеснили или сдвинули мимо сигналов. Права кэш всё равно не проверяет:
+только кнопки и выборка ленты.
+"""
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import bump, get_versions
+from .models import Follow
+
+
+def _scope(user_id):
+    return f'following:{user_id}'
+
+
+class FollowingCache:
+
+    def __init__(self, max_users, timeout=60):
+        self.max_users = max_users
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, user_id):
+        # Версию читаем до базы: если подписки поменяют, пока мы читаем,
+        # запись ляжет под старой версией и следующее чтение её обновит.
+        version = get_versions([_scope(user_id)])[_scope(user_id)]
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self._data.move_to_end(user_id)
+                return entry[2]
+        ids = array('q', sorted(Follow.objects.filter(
+            user_id=user_id).values_list('author_id', flat=True)))
+        with self._lock:
+            self._data[user_id] = (version, now + self.timeout, ids)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_users:
+                self._data.popitem(last=False)
+        return ids
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+        bump(_scope(user_id))
+        # Между сигналом и коммитом другой процесс мог прочитать из базы
+        # прежние подписки уже под новой версией: сдвигаем её ещё раз.
+        transaction.on_commit(partial(bump, _scope(user_id)))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+following_cache = FollowingCache(
+    getattr(settings, 'FOLLOWING_CACHE_SIZE', 10000),
+    getattr(settings, 'FOLLOWING_CACHE_TIMEOUT', 60))
+
+
+def following_ids(user):
+    """id авторов, на которых подписан пользователь (по возрастанию)."""
+    if not user.is_authenticated:
+        return array('q')
+    return following_cache.get(user.pk)
+
+
+def is_following(user, author):
+    ids = following_ids(user)
+    index = bisect_left(ids, author.pk)
+    return index < len(ids) and ids[index] == author.pk
@@ -1,5 +1,9 @@
 # from attr import fields
+from functools import partial
+
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from . import uploads
 from .models import Post, Comment
 from django.utils.translation import ugettext_lazy as _
 
@@ -19,6 +23,21 @@ class PostForm(forms.ModelForm):
                        '(необязательное поле)')
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ImageField.to_python уже открывает и проверяет картинку
+        # целиком: заголовок смотрим раньше него. Само поле остаётся
+        # forms.ImageField.
+        field = self.fields['image']
+        field.to_python = partial(uploads.checked, field.to_python)
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Старая картинка поста при правке приходит FieldFile.
+        if isinstance(image, UploadedFile):
+            image = uploads.normalize(image)
+        return image
+
 
 # Форма для добавления комментария к посту
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,108 @@
+"""Счётчики ссылок на файлы картинок постов.
+
+Картинки лежат в ContentAddressedStorage (posts.storage), и один файл
+может принадлежать многим постам. Сигналы (posts.signals) вызывают
+acquire/release при создании, смене картинки и удалении поста; файл и
+его миниатюры удаляются, когда ссылок не остаётся.
+"""
+import logging
+import os
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from sorl.thumbnail import delete as delete_thumbnails
+
+from .models import Post, StoredImage
+
+logger = logging.getLogger(__name__)
+
+
+def _create(name):
+    references = Post.objects.filter(image=name).count()
+    try:
+        with transaction.atomic():
+            StoredImage.objects.create(name=name, references=references)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос.
+        return StoredImage.objects.get(name=name).references
+    return references
+
+
+def acquire(name, content=None):
+    """Пост стал ссылаться на файл. Если строки ещё нет, она считается
+    заново — пост, ради которого нас позвали, уже в базе.
+
+    content — загруженная картинка. Хранилище могло не записать её,
+    найдя такой же файл, а тот успели удалить вместе с последним
+    прежним постом: тогда файл пишется заново.
+    """
+    updated = StoredImage.objects.filter(name=name).update(
+        references=F('references') + 1)
+    if not updated:
+        _create(name)
+    if content is not None:
+        _restore(name, content)
+
+
+def _restore(name, content):
+    field = Post._meta.get_field('image')
+    if field.storage.exists(name):
+        return
+    try:
+        content.seek(0)
+        # Хранилище само выберет подкаталог по хэшу содержимого.
+        restored = field.storage.save(os.path.join(
+            field.upload_to, os.path.basename(name)), content)
+    except OSError:
+        logger.exception('Файл картинки %s пропал', name)
+        return
+    if restored != name:
+        logger.error('Картинка %s восстановлена как %s', name, restored)
+
+
+def release(name):
+    """Пост перестал ссылаться на файл: последний удаляет файл."""
+    updated = StoredImage.objects.filter(
+        name=name, references__gt=0).update(references=F('references') - 1)
+    if updated:
+        references = StoredImage.objects.filter(name=name).values_list(
+            'references', flat=True).first()
+    else:
+        references = _create(name)
+    if references <= 0:
+        transaction.on_commit(lambda: _delete_unused(name))
+
+
+def recount(names):
+    """Пересчитывает ссылки на файлы names по таблице постов; строки
+    файлов, на которые ничего не ссылается, удаляются. Нужен после
+    массовых правок без сигналов (bulk_update)."""
+    counts = dict(Post.objects.filter(image__in=names).values_list(
+        'image').annotate(references=Count('pk')).order_by())
+    with transaction.atomic():
+        StoredImage.objects.filter(name__in=names).delete()
+        StoredImage.objects.bulk_create(
+            StoredImage(name=name, references=references)
+            for name, references in counts.items())
+
+
+def _delete_unused(name):
+    # Пока ждали коммита, ту же картинку могли загрузить снова: тогда
+    # хранилище уже вернуло новому посту этот файл. Ссылки перечитываем
+    # под блокировкой строки, чтобы не разойтись с acquire.
+    with transaction.atomic():
+        image = StoredImage.objects.select_for_update().filter(
+            name=name).first()
+        if ((image is not None and image.references > 0)
+                or Post.objects.filter(image=name).exists()):
+            return
+        if image is not None:
+            image.delete()
+    try:
+        delete_thumbnails(name)
+    except (SuspiciousFileOperation, OSError):
+        # Колбэк после коммита: ошибка здесь сломала бы удаление поста,
+        # которое уже состоялось. Файл вне MEDIA_ROOT (имя вписали
+        # руками) или недоступный диск — повод для лога, не для 500.
+        logger.exception('Не удалось удалить картинку %s', name)
@@ -0,0 +1,83 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from posts import counters, timeline
+from posts.models import Follow, Post, TimelineEntry
+from posts.paginator import paginate
+from posts.views import PAGE_PER_LIST
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Замеряет цену записи и чтения ленты подписок по обе стороны '
+            'порога FEED_FANOUT_MAX_FOLLOWERS. Все данные создаются '
+            'в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=200,
+                            help='постов у автора до замера')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        self.stdout.write(
+            f'{"режим":<6} {"подписчиков":>12} {"вставок на пост":>16} '
+            f'{"запись, мс":>11} {"чтение, мс":>11}')
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=threshold):
+            for followers in (threshold // 2, threshold * 2):
+                try:
+                    with transaction.atomic():
+                        self.run_case(followers, options)
+                        raise Rollback
+                except Rollback:
+                    pass
+
+    def run_case(self, followers, options):
+        author = User.objects.create_user(username='benchmark_author')
+        User.objects.bulk_create(
+            User(username=f'benchmark_reader_{i}') for i in range(followers))
+        readers = User.objects.filter(
+            username__startswith='benchmark_reader_')
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for reader in readers)
+        # bulk_create не шлёт сигналов: счётчики и ленты готовим руками.
+        counters.rebuild()
+        timeline.promote(author.pk, followers)
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=author)
+            for i in range(options['posts']))
+        for reader in readers.values_list('pk', flat=True).iterator():
+            timeline.backfill(reader, author.pk)
+
+        before = TimelineEntry.objects.count()
+        started = perf_counter()
+        for i in range(options['repeat']):
+            Post.objects.create(text=f'Новый пост {i}', author=author)
+        write_ms = (perf_counter() - started) * 1000 / options['repeat']
+        inserts = (TimelineEntry.objects.count() - before) / options['repeat']
+
+        reader = readers.first()
+        feed = timeline.follow_feed(reader, [author.pk])
+        request = RequestFactory().get('/follow/')
+        started = perf_counter()
+        for _ in range(options['repeat']):
+            page = paginate(request, feed, PAGE_PER_LIST,
+                            ordering=('pub_date', 'post_id'))
+            list(page)
+        read_ms = (perf_counter() - started) * 1000 / options['repeat']
+
+        mode = 'pull' if timeline.is_pulled(author.pk) else 'push'
+        self.stdout.write(
+            f'{mode:<6} {followers:>12} {inserts:>16.0f} '
+            f'{write_ms:>11.2f} {read_ms:>11.2f}')
@@ -0,0 +1,27 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = ('Заново заполняет полнотекстовый индекс постов. Нужен, если '
+            'индекс разошёлся с таблицей постов (например, после правки '
+            'базы в обход триггеров); до конца перестройки поиск находит '
+            'не всё.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='диапазон id постов в одной транзакции')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+
+        def progress(done, last, total):
+            self.stdout.write(f'id до {done}/{last}, постов: {total}')
+
+        total = search.rebuild(options['chunk_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {total} за '
+            f'{perf_counter() - started:.1f} с'))
@@ -0,0 +1,90 @@
+import re
+from functools import partial
+from time import perf_counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import cache, images, thumbnails
+from posts.models import Post
+from posts.storage import SHARD_LEVELS, SHARD_WIDTH
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов из плоского каталога в '
+            'подкаталоги по хэшу содержимого и переписывает Post.image '
+            'пачками. Повторный запуск продолжает с места остановки. '
+            'Затем нарезает миниатюры под новыми именами и удаляет '
+            'старые.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='постов в одной пачке')
+        parser.add_argument('--skip-thumbnails', action='store_true',
+                            help='не запускать thumbnails warm и purge')
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        directory = field.upload_to.rstrip('/')
+        sharded = '/'.join([r'[0-9a-f]{%d}' % SHARD_WIDTH] * SHARD_LEVELS)
+        posts = Post.objects.exclude(image='').exclude(
+            image__regex=rf'^{re.escape(directory)}/{sharded}/').order_by(
+            'pk').only('pk', 'image')
+        total = posts.count()
+        done = moved = 0
+        started = perf_counter()
+        batch = list(posts[:options['batch_size']])
+        while batch:
+            moved += self.move_batch(field.storage, directory, batch)
+            done += len(batch)
+            elapsed = perf_counter() - started
+            self.stdout.write(
+                f'{done}/{total} постов, перенесено файлов {moved}, '
+                f'{done / elapsed if elapsed else 0:.1f} постов/с')
+            # Пачки по ключу: посты, чей файл пропал, остаются в
+            # выборке, и на них нельзя зациклиться.
+            batch = list(posts.filter(
+                pk__gt=batch[-1].pk)[:options['batch_size']])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: перенесено {moved} файлов за '
+            f'{perf_counter() - started:.1f} с'))
+        if moved and not options['skip_thumbnails']:
+            call_command('thumbnails', 'warm', stdout=self.stdout)
+            call_command('thumbnails', 'purge', stdout=self.stdout)
+
+    def move_batch(self, storage, directory, posts):
+        renamed = {}
+        for name in {post.image.name for post in posts}:
+            if storage.exists(name):
+                renamed[name] = storage.link(name, directory)
+            else:
+                self.stderr.write(f'Нет файла {name}')
+        # Тот же файл может быть и у постов из следующих пачек:
+        # переписываем всех владельцев сразу.
+        owners = list(Post.objects.filter(
+            image__in=list(renamed)).select_related('author', 'group'))
+        scopes = set()
+        for post in owners:
+            post.image = renamed[post.image.name]
+            scopes.update(thumbnails.post_scopes(post))
+        # bulk_update не шлёт сигналов: счётчики ссылок правим сами.
+        # Старые файлы удаляются только после коммита: упади команда
+        # раньше, посты ссылаются на них, а перезапуск найдёт новые
+        # файлы уже на месте.
+        with transaction.atomic():
+            Post.objects.bulk_update(owners, ['image'], batch_size=500)
+            images.recount([*renamed, *renamed.values()])
+            transaction.on_commit(partial(self.delete_old, storage, [
+                name for name, new_name in renamed.items()
+                if name != new_name]))
+        # В закэшированных страницах ссылки на старые файлы.
+        cache.bump(*scopes)
+        return len(renamed)
+
+    def delete_old(self, storage, names):
+        for name in names:
+            try:
+                storage.delete(name)
+            except OSError as error:
+                self.stderr.write(f'Не удалось удалить {name}: {error}')
@@ -0,0 +1,159 @@
+import logging
+import os
+from time import perf_counter
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts import cache, thumbnails, uploads
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def preview_file(name):
+    """uploads.preview() сохранённой картинки; выполняется в пуле."""
+    storage = Post._meta.get_field('image').storage
+    try:
+        with storage.open(name) as file:
+            return uploads.preview(file)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        logger.exception('Не удалось посчитать превью %s', name)
+        return '', ''
+
+
+class Command(BaseCommand):
+    help = ('Обслуживает миниатюры картинок постов. warm нарезает '
+            'недостающие, rebuild пересоздаёт все (например, после смены '
+            'POST_THUMBNAILS), purge удаляет файлы и записи kvstore, '
+            'которые не принадлежат ни одному посту, previews считает '
+            'заглушки картинок постов, загруженных до их появления.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action', choices=('warm', 'rebuild', 'purge', 'previews'))
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='процессов в пуле')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='постов в одной пачке')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'purge':
+            self.purge()
+            return
+        with thumbnails.make_executor(options['workers']) as executor:
+            if options['action'] == 'previews':
+                self.previews(executor, options['chunk_size'])
+                return
+            self.build(executor, options['chunk_size'],
+                       force=options['action'] == 'rebuild')
+
+    def chunks(self, queryset, size):
+        # Пачки по ключу, а не один открытый курсор: между пачками
+        # пишем в kvstore, а SQLite плохо переносит запись посреди
+        # незавершённого чтения.
+        chunk = list(queryset[:size])
+        while chunk:
+            yield chunk
+            chunk = list(queryset.filter(pk__gt=chunk[-1].pk)[:size])
+
+    def build(self, executor, chunk_size, force):
+        posts = Post.objects.exclude(image='').select_related(
+            'author', 'group').order_by('pk')
+        total = posts.count()
+        geometries = thumbnails.geometries()
+        done = built = 0
+        started = perf_counter()
+        for chunk in self.chunks(posts, chunk_size):
+            done += len(chunk)
+            if force:
+                for post in chunk:
+                    default.kvstore.delete(ImageFile(post.image.name))
+            else:
+                chunk = thumbnails.missing(chunk)
+            built += self.build_chunk(executor, chunk, geometries)
+            self.report(done, total, built, started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: нарезаны миниатюры {built} картинок'))
+
+    def build_chunk(self, executor, posts, geometries):
+        names = [post.image.name for post in posts]
+        scopes = set()
+        built = 0
+        for post, results in zip(posts, executor.map(
+                thumbnails.render_all, names, [geometries] * len(names))):
+            if results:
+                thumbnails.register(post.image.name, results)
+                scopes.update(thumbnails.post_scopes(post))
+                built += 1
+        # Страницы, закэшированные с заглушками, строятся заново.
+        cache.bump(*scopes)
+        return built
+
+    def previews(self, executor, chunk_size):
+        posts = Post.objects.exclude(image='').filter(
+            image_preview='').select_related('author', 'group').order_by('pk')
+        total = posts.count()
+        done = built = 0
+        started = perf_counter()
+        for chunk in self.chunks(posts, chunk_size):
+            done += len(chunk)
+            scopes = set()
+            for post, (color, preview) in zip(chunk, executor.map(
+                    preview_file, [post.image.name for post in chunk])):
+                post.image_color, post.image_preview = color, preview
+                if preview:
+                    scopes.update(thumbnails.post_scopes(post))
+                    built += 1
+            # bulk_update не шлёт сигналов, и файлы не трогаются.
+            Post.objects.bulk_update(
+                chunk, ['image_color', 'image_preview'])
+            cache.bump(*scopes)
+            self.report(done, total, built, started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: посчитаны превью {built} картинок'))
+
+    def report(self, done, total, built, started):
+        elapsed = perf_counter() - started
+        self.stdout.write(
+            f'{done}/{total} постов, нарезано {built}, '
+            f'{built / elapsed if elapsed else 0:.1f} картинок/с')
+
+    def purge(self):
+        started = perf_counter()
+        sources, expected = set(), set()
+        images = Post.objects.exclude(image='').values_list(
+            'image', flat=True)
+        for name in images.iterator():
+            sources.add(name)
+            expected |= thumbnails.thumbnail_names(name)
+        keep = sources | expected
+        entries = 0
+        kvstore = default.kvstore
+        for key in list(kvstore._find_keys(identity='image')):
+            image_file = kvstore._get(key)
+            if image_file is None or image_file.name in keep:
+                continue
+            kvstore._delete(key)
+            kvstore._delete(key, identity='thumbnails')
+            entries += 1
+        files = 0
+        for name in self.walk(sorl_settings.THUMBNAIL_PREFIX.rstrip('/')):
+            if name not in expected:
+                default.storage.delete(name)
+                files += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {files}, записей kvstore: {entries} '
+            f'за {perf_counter() - started:.1f} с'))
+
+    def walk(self, path):
+        if not default.storage.exists(path):
+            return
+        directories, files = default.storage.listdir(path)
+        for name in files:
+            yield f'{path}/{name}'
+        for directory in directories:
+            yield from self.walk(f'{path}/{directory}')
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='counter',
+            name='kind',
+            field=models.CharField(choices=[('author_posts', 'Постов автора'), ('group_posts', 'Постов в группе'), ('post_comments', 'Комментариев к посту'), ('total_posts', 'Всего постов'), ('author_followers', 'Подписчиков автора')], max_length=20, verbose_name='Что считаем'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import migrations
+
+POST_ROW = '''
+INSERT INTO posts_post_search (rowid, text, group_title, username)
+SELECT new.id, new.text,
+       (SELECT title FROM posts_group WHERE id = new.group_id),
+       (SELECT username FROM auth_user WHERE id = new.author_id);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0020_post_image_preview'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE posts_post_search USING fts5("
+                "text, group_title, username, "
+                "tokenize = 'unicode61 remove_diacritics 2')",
+                'INSERT INTO posts_post_search '
+                '(rowid, text, group_title, username) '
+                'SELECT post.id, post.text, grp.title, author.username '
+                'FROM posts_post AS post '
+                'JOIN auth_user AS author ON author.id = post.author_id '
+                'LEFT JOIN posts_group AS grp ON grp.id = post.group_id',
+                'CREATE TRIGGER posts_post_search_insert '
+                'AFTER INSERT ON posts_post BEGIN'
+                + POST_ROW + 'END',
+                'CREATE TRIGGER posts_post_search_update '
+                'AFTER UPDATE OF text, group_id, author_id ON posts_post '
+                'BEGIN DELETE FROM posts_post_search WHERE rowid = old.id;'
+                + POST_ROW + 'END',
+                'CREATE TRIGGER posts_post_search_delete '
+                'AFTER DELETE ON posts_post BEGIN '
+                'DELETE FROM posts_post_search WHERE rowid = old.id; END',
+                'CREATE TRIGGER posts_group_search_update '
+                'AFTER UPDATE OF title ON posts_group BEGIN '
+                'UPDATE posts_post_search SET group_title = new.title '
+                'WHERE rowid IN '
+                '(SELECT id FROM posts_post WHERE group_id = new.id); END',
+                'CREATE TRIGGER auth_user_search_update '
+                'AFTER UPDATE OF username ON auth_user BEGIN '
+                'UPDATE posts_post_search SET username = new.username '
+                'WHERE rowid IN '
+                '(SELECT id FROM posts_post WHERE author_id = new.id); END',
+            ],
+            reverse_sql=[
+                'DROP TRIGGER auth_user_search_update',
+                'DROP TRIGGER posts_group_search_update',
+                'DROP TRIGGER posts_post_search_delete',
+                'DROP TRIGGER posts_post_search_update',
+                'DROP TRIGGER posts_post_search_insert',
+                'DROP TABLE posts_post_search',
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:35
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mark_pulled_authors(apps, schema_editor):
+    Counter = apps.get_model('posts', 'Counter')
+    PulledAuthor = apps.get_model('posts', 'PulledAuthor')
+    limit = getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+    authors = Counter.objects.filter(
+        kind='author_followers', value__gt=limit).values_list(
+            'object_id', flat=True)
+    # Когда авторы перешли порог, неизвестно: считаем, что их посты не
+    # разложены вовсе, и при возврате к push раскладываем всё.
+    since = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    PulledAuthor.objects.bulk_create(
+        [PulledAuthor(author_id=author_id, since=since)
+         for author_id in authors])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0021_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PulledAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('since', models.DateTimeField(verbose_name='Читается при показе ленты с')),
+            ],
+            options={
+                'verbose_name': 'Популярный автор',
+                'verbose_name_plural': 'Популярные авторы',
+            },
+        ),
+        migrations.RunPython(mark_pulled_authors, migrations.RunPython.noop),
+    ]
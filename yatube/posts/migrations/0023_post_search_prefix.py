@@ -0,0 +1,35 @@
+from django.db import migrations
+
+FILL = (
+    'INSERT INTO posts_post_search (rowid, text, group_title, username) '
+    'SELECT post.id, post.text, grp.title, author.username '
+    'FROM posts_post AS post '
+    'JOIN auth_user AS author ON author.id = post.author_id '
+    'LEFT JOIN posts_group AS grp ON grp.id = post.group_id'
+)
+
+
+def create(options):
+    return [
+        'DROP TABLE posts_post_search',
+        "CREATE VIRTUAL TABLE posts_post_search USING fts5("
+        "text, group_title, username, "
+        "tokenize = 'unicode61 remove_diacritics 2'" + options + ")",
+        FILL,
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_pulledauthor'),
+    ]
+
+    # Префиксные индексы на 2 и 3 символа: короткий префикс иначе
+    # перебирает все слова словаря, которые с него начинаются.
+    operations = [
+        migrations.RunSQL(
+            sql=create(", prefix = '2 3'"),
+            reverse_sql=create(''),
+        ),
+    ]
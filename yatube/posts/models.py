@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.db.models.constraints import UniqueConstraint
 
+from .storage import ContentAddressedStorage
+
 
 User = get_user_model()
 
@@ -38,10 +40,27 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True)
+    # Заглушка картинки (posts.uploads.preview), которую карточка
+    # показывает сразу, пока грузится миниатюра.
+    image_color = models.CharField(
+        'Основной цвет картинки', max_length=7, blank=True, editable=False)
+    image_preview = models.TextField(
+        'Превью картинки', blank=True, editable=False)
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        # Индексы под курсорную пагинацию лент: (pub_date, id) целиком
+        # и с префиксом автора/группы для профиля и страницы группы.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_feed_idx'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -81,3 +100,112 @@ class Follow(models.Model):
     UniqueConstraint(
         fields=['user', 'author'],
         name='unique_follow')
+
+
+class Counter(models.Model):
+    """Денормализованный счётчик: постов автора, группы, всего постов,
+    комментариев к посту и подписчиков автора. Поддерживается сигналами
+    (posts.signals) и пересчитывается командой rebuild_counters."""
+
+    AUTHOR_POSTS = 'author_posts'
+    GROUP_POSTS = 'group_posts'
+    POST_COMMENTS = 'post_comments'
+    TOTAL_POSTS = 'total_posts'
+    AUTHOR_FOLLOWERS = 'author_followers'
+    KIND_CHOICES = (
+        (AUTHOR_POSTS, 'Постов автора'),
+        (GROUP_POSTS, 'Постов в группе'),
+        (POST_COMMENTS, 'Комментариев к посту'),
+        (TOTAL_POSTS, 'Всего постов'),
+        (AUTHOR_FOLLOWERS, 'Подписчиков автора'),
+    )
+
+    kind = models.CharField('Что считаем', max_length=20,
+                            choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField('id объекта', default=0)
+    value = models.IntegerField('Значение', default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['kind', 'object_id'],
+                             name='unique_counter'),
+        ]
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}={self.value}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок: пост автора, на которого
+    подписан пользователь. Заполняется при публикации поста
+    (fan-out on write), поэтому /follow/ читает один диапазон индекса."""
+
+    user = models.ForeignKey(
+        User,
+        models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['user', 'post'],
+                             name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_feed_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_author_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+
+class PulledAuthor(models.Model):
+    """Популярный автор, чьи посты не раскладываются по лентам, а
+    подмешиваются при чтении (posts.timeline). Посты до since уже
+    лежат в лентах подписчиков, новее — нет."""
+
+    author = models.OneToOneField(
+        User,
+        models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    since = models.DateTimeField('Читается при показе ленты с')
+
+    class Meta:
+        verbose_name = 'Популярный автор'
+        verbose_name_plural = 'Популярные авторы'
+
+    def __str__(self):
+        return f'{self.author_id} с {self.since}'
+
+
+class StoredImage(models.Model):
+    """Файл картинки в ContentAddressedStorage и число постов, которые
+    на него ссылаются (posts.images). Файл удаляется вместе с последней
+    ссылкой."""
+
+    name = models.CharField('Имя файла', max_length=100, unique=True)
+    references = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
@@ -0,0 +1,196 @@
+import base64
+import binascii
+from math import ceil
+
+from django.core.paginator import EmptyPage, InvalidPage, Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id).
+
+    Помимо обычных номеров страниц умеет отдавать страницу по курсору:
+    вместо OFFSET запрос начинается с позиции последнего показанного
+    поста, поэтому глубокие страницы стоят столько же, сколько первая.
+    """
+
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, object_list, per_page,
+                 ordering=('pub_date', 'id'), **kwargs):
+        self.date_field, self.id_field = ordering
+        object_list = object_list.order_by(
+            f'-{self.date_field}', f'-{self.id_field}')
+        super().__init__(object_list, per_page, **kwargs)
+
+    def encode_cursor(self, obj, direction):
+        pub_date = getattr(obj, self.date_field)
+        pk = getattr(obj, self.id_field)
+        raw = f'{direction}{pub_date.isoformat()}|{pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (direction, pub_date, id) или None для мусора."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            direction, raw = raw[0], raw[1:]
+            pub_date, pk = raw.rsplit('|', 1)
+            pub_date, pk = parse_datetime(pub_date), int(pk)
+        except (binascii.Error, UnicodeError, ValueError, IndexError):
+            return None
+        if direction not in (self.NEXT, self.PREVIOUS) or pub_date is None:
+            return None
+        return direction, pub_date, pk
+
+    def _seek(self, direction, pub_date, pk):
+        # Условие по pub_date вынесено отдельно, чтобы SQLite начинал
+        # чтение индекса сразу с нужной позиции, а не фильтровал с начала.
+        if direction == self.NEXT:
+            return self.object_list.filter(
+                Q(**{f'{self.date_field}__lte': pub_date}),
+                Q(**{f'{self.date_field}__lt': pub_date})
+                | Q(**{f'{self.id_field}__lt': pk}),
+            )
+        return self.object_list.filter(
+            Q(**{f'{self.date_field}__gte': pub_date}),
+            Q(**{f'{self.date_field}__gt': pub_date})
+            | Q(**{f'{self.id_field}__gt': pk}),
+        ).reverse()
+
+    def get_cursor_page(self, cursor):
+        """Страница по курсору; при битом курсоре отдаём первую."""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return self.page(1)
+        direction = decoded[0]
+        objects = list(self._seek(*decoded)[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if direction == self.PREVIOUS:
+            objects.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = True, has_more
+        if not objects:
+            return self.page(1)
+        page = Page(objects, None, self)
+        self._set_cursors(page, has_previous, has_next)
+        return page
+
+    def page(self, number):
+        page = super().page(number)
+        self._set_cursors(page, page.has_previous(), page.has_next())
+        return page
+
+    def _set_cursors(self, page, has_previous, has_next):
+        page.previous_cursor = page.next_cursor = None
+        if not len(page):
+            return
+        if has_previous:
+            page.previous_cursor = self.encode_cursor(page[0], self.PREVIOUS)
+        if has_next:
+            page.next_cursor = self.encode_cursor(page[-1], self.NEXT)
+
+
+class YatubePaginator(CursorPaginator):
+    """Пагинатор лент Yatube без COUNT(*) по всей таблице.
+
+    Номера страниц ограничены MAX_PAGE, в навигации показывается только
+    окно из WINDOW страниц по обе стороны от текущей. Чтобы нарисовать
+    окно, достаточно узнать, сколько записей лежит сразу за страницей,
+    поэтому вместо полного подсчёта считается только ограниченный хвост.
+    Дальше MAX_PAGE листают по курсору.
+
+    Если известен count (например, из posts.counters), хвост не
+    считается вовсе; счётчику доверяем, пока он не противоречит странице.
+    """
+
+    WINDOW = 2
+    MAX_PAGE = 100
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_count = count
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage('Номер страницы должен быть целым числом')
+        if not 1 <= number <= self.MAX_PAGE:
+            raise EmptyPage('Нет такой страницы')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        objects = list(self.object_list[bottom:top])
+        if not objects and number > 1:
+            raise EmptyPage('Нет такой страницы')
+        count = bottom + len(objects)
+        more_pages = False
+        if len(objects) == self.per_page:
+            if self.known_count is not None and self.known_count > count:
+                count = self.known_count
+            else:
+                tail = self.object_list[top:top + self.per_page * self.WINDOW]
+                tail = tail.count()
+                count += tail
+                # Хвост заполнен целиком — за окном, скорее всего, есть ещё.
+                more_pages = tail == self.per_page * self.WINDOW
+        # Paginator.count — cached_property: подставляем известное нам
+        # значение, и has_next()/num_pages считают без COUNT(*).
+        self.count = count
+        page = Page(objects, number, self)
+        self._set_cursors(page, page.has_previous(), page.has_next())
+        last = min(ceil(self.count / self.per_page), self.MAX_PAGE)
+        page.page_window = range(
+            max(1, number - self.WINDOW), min(last, number + self.WINDOW) + 1)
+        page.more_pages = (
+            more_pages or count > (number + self.WINDOW) * self.per_page)
+        return page
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который не считает всю выборку.
+
+    Известное число записей (например, из posts.counters) передают в
+    count; иначе считается не больше MAX_COUNT строк, и дальше этого
+    числа страницы не листаются. Для админки, где COUNT(*) по большой
+    таблице стоит дороже самой страницы.
+    """
+
+    MAX_COUNT = 10000
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, count=None):
+        super().__init__(object_list, per_page, orphans,
+                         allow_empty_first_page)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        return self.object_list[:self.MAX_COUNT].count()
+
+
+def paginate(request, queryset, per_page, count=None, **kwargs):
+    """Страница ленты: по курсору, если он передан, иначе по номеру.
+
+    Для несуществующего номера страницы возвращает None — вьюха
+    перенаправляет на первую страницу.
+    """
+    paginator = YatubePaginator(queryset, per_page, count=count, **kwargs)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        return paginator.get_cursor_page(cursor)
+    try:
+        return paginator.page(request.GET.get('page', 1))
+    except InvalidPage:
+        return None
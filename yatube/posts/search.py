@@ -0,0 +1,93 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Таблица posts_post_search (миграция 0021) хранит текст поста, название
+группы и имя автора под rowid, равным id поста, с префиксными
+индексами на 2 и 3 символа (миграция 0023). Синхронизацию держат
+триггеры SQLite на posts_post, posts_group и auth_user: они срабатывают
+и на bulk_create/update(), мимо которых проходят сигналы Django.
+
+Выдача сортируется по bm25 (WEIGHTS — веса столбцов) и листается
+смещением, но не дальше MAX_PAGE страниц: ранжированная выдача не
+ложится на курсор по дате, а так глубина OFFSET ограничена.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+TABLE = 'posts_post_search'
+# Веса столбцов для bm25: text, group_title, username.
+WEIGHTS = (1.0, 0.5, 0.5)
+MAX_TERMS = 10
+MAX_PAGE = 100
+
+# OR REPLACE: пока идёт rebuild(), триггер может успеть вставить строку
+# поста из ещё не залитой пачки.
+FILL = f'''
+INSERT OR REPLACE INTO {TABLE} (rowid, text, group_title, username)
+SELECT post.id, post.text, grp.title, author.username
+FROM posts_post AS post
+JOIN auth_user AS author ON author.id = post.author_id
+LEFT JOIN posts_group AS grp ON grp.id = post.group_id
+WHERE post.id > %s AND post.id <= %s
+'''
+
+
+def match_expression(query):
+    """Запрос пользователя в синтаксисе MATCH: все слова обязательны,
+    последнее — префикс (его, возможно, ещё дописывают). Операторы и
+    кавычки FTS5 из ввода не проходят. None, если искать нечего."""
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    *words, last = terms
+    return ' '.join([f'"{term}"' for term in words] + [f'"{last}"*'])
+
+
+def filter_posts(queryset, query):
+    """queryset постов, сужённый до совпадений с запросом, без
+    ранжирования; например, для поиска в админке. Пустой запрос
+    оставляет queryset как есть."""
+    expression = match_expression(query)
+    if expression is None:
+        return queryset
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [expression]))
+
+
+def search(query, page=1, per_page=10):
+    """Посты страницы page по запросу и есть ли следующая страница."""
+    expression = match_expression(query)
+    if expression is None or not 1 <= page <= MAX_PAGE:
+        return [], False
+    weights = ', '.join(map(str, WEIGHTS))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'ORDER BY bm25({TABLE}, {weights}) LIMIT %s OFFSET %s',
+            [expression, per_page + 1, (page - 1) * per_page])
+        ids = [row[0] for row in cursor.fetchall()]
+    has_next = len(ids) > per_page and page < MAX_PAGE
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        ids[:per_page])
+    return [posts[pk] for pk in ids[:per_page] if pk in posts], has_next
+
+
+def rebuild(chunk_size=10000, progress=None):
+    """Заполняет индекс заново пачками по id и сжимает его. Возвращает
+    число проиндексированных постов."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute('SELECT MAX(id) FROM posts_post')
+        last = cursor.fetchone()[0] or 0
+        total = 0
+        for start in range(0, last, chunk_size):
+            with transaction.atomic():
+                cursor.execute(FILL, [start, start + chunk_size])
+            total += cursor.rowcount
+            if progress:
+                progress(min(start + chunk_size, last), last, total)
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
@@ -0,0 +1,239 @@
+import logging
+from functools import partial
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache, counters, images, thumbnails, timeline, uploads
+from .conditional import user_scope
+from .following import following_cache
+from .models import Comment, Counter, Follow, Group, Post, User
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_owners(sender, instance, **kwargs):
+    """Запоминает автора, группу и картинку до правки, чтобы перенести
+    счётчики и ссылки на файл, и новую загрузку."""
+    instance._old_owners = instance._old_image = None
+    # Сама загрузка: после сохранения в поле остаётся только имя файла.
+    image = instance.image
+    instance._uploaded_image = (
+        image.file if image and not image._committed else None)
+    if instance.pk:
+        row = Post.objects.filter(pk=instance.pk).values_list(
+            'author_id', 'group_id', 'image').first()
+        if row:
+            instance._old_owners, instance._old_image = row[:2], row[2]
+
+
+@receiver(pre_save, sender=Post)
+def compute_image_preview(sender, instance, raw=False, **kwargs):
+    """Заглушка новой картинки считается до сохранения, пока
+    загруженный файл ещё под рукой."""
+    if raw:
+        return
+    image = instance.image
+    if not image:
+        instance.image_color = instance.image_preview = ''
+        return
+    if image.name == instance._old_image and instance.image_preview:
+        return
+    # Незакоммиченный файл — сама загрузка: её ещё сохранять, поэтому
+    # закрываем только то, что открыли из хранилища.
+    uploaded = not image._committed
+    try:
+        image.open('rb')
+        instance.image_color, instance.image_preview = uploads.preview(image)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        logger.exception('Не удалось посчитать превью %s', image.name)
+        instance.image_color = instance.image_preview = ''
+    finally:
+        if not uploaded:
+            image.close()
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_owners = getattr(instance, '_old_owners', None)
+    if created:
+        timeline.fan_out(instance)
+    if created or old_owners is None:
+        counters.change(Counter.TOTAL_POSTS)
+        counters.change(Counter.AUTHOR_POSTS, instance.author_id)
+        if instance.group_id:
+            counters.change(Counter.GROUP_POSTS, instance.group_id)
+        return
+    old_author_id, old_group_id = old_owners
+    if old_author_id != instance.author_id:
+        counters.change(Counter.AUTHOR_POSTS, old_author_id, -1)
+        counters.change(Counter.AUTHOR_POSTS, instance.author_id)
+    if old_group_id != instance.group_id:
+        if old_group_id:
+            counters.change(Counter.GROUP_POSTS, old_group_id, -1)
+        if instance.group_id:
+            counters.change(Counter.GROUP_POSTS, instance.group_id)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change(Counter.TOTAL_POSTS, delta=-1)
+    counters.change(Counter.AUTHOR_POSTS, instance.author_id, -1)
+    if instance.group_id:
+        counters.change(Counter.GROUP_POSTS, instance.group_id, -1)
+    Counter.objects.filter(
+        kind=Counter.POST_COMMENTS, object_id=instance.pk).delete()
+
+
+def _feed_scopes(author_ids, group_ids):
+    scopes = [cache.FEED]
+    scopes += [f'author:{username}' for username in User.objects.filter(
+        pk__in=author_ids).values_list('username', flat=True)]
+    scopes += [f'group:{slug}' for slug in Group.objects.filter(
+        pk__in=group_ids).values_list('slug', flat=True)]
+    return scopes
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    author_ids = {instance.author_id}
+    group_ids = {instance.group_id}
+    old_owners = getattr(instance, '_old_owners', None)
+    if old_owners:
+        author_ids.add(old_owners[0])
+        group_ids.add(old_owners[1])
+    cache.bump(f'post:{instance.pk}',
+               *_feed_scopes(author_ids, group_ids - {None}))
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_image = getattr(instance, '_old_image', None)
+    if instance.image.name == old_image:
+        return
+    if instance.image:
+        images.acquire(instance.image.name,
+                       getattr(instance, '_uploaded_image', None))
+    if old_image:
+        images.release(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    if instance.image:
+        images.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if instance.image and not raw:
+        transaction.on_commit(partial(thumbnails.schedule, instance.image))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._old_slug = None
+    if instance.pk:
+        instance._old_slug = Group.objects.filter(
+            pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = {cache.FEED, f'group:{instance.slug}'}
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug:
+        scopes.add(f'group:{old_slug}')
+    cache.bump(*scopes)
+
+
+@receiver(post_delete, sender=Group)
+def drop_group_counter(sender, instance, **kwargs):
+    Counter.objects.filter(
+        kind=Counter.GROUP_POSTS, object_id=instance.pk).delete()
+
+
+# Поля пользователя, которые видны в карточках и ссылках на профиль.
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_user_name(sender, instance, update_fields=None, **kwargs):
+    # Вход сохраняет только last_login — базу лишний раз не трогаем.
+    instance._old_name = None
+    if instance.pk and (update_fields is None
+                        or set(update_fields) & set(USER_NAME_FIELDS)):
+        instance._old_name = User.objects.filter(
+            pk=instance.pk).values_list(*USER_NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def bump_author_pages(sender, instance, raw=False, **kwargs):
+    old_name = getattr(instance, '_old_name', None)
+    name = tuple(getattr(instance, field) for field in USER_NAME_FIELDS)
+    if raw or old_name is None or old_name == name:
+        return
+    slugs = Group.objects.filter(posts__author=instance).values_list(
+        'slug', flat=True).distinct()
+    cache.bump(cache.FEED, f'author:{old_name[0]}',
+               f'author:{instance.username}',
+               *[f'group:{slug}' for slug in slugs])
+
+
+@receiver(post_delete, sender=User)
+def drop_author_counters(sender, instance, **kwargs):
+    Counter.objects.filter(
+        kind__in=(Counter.AUTHOR_POSTS, Counter.AUTHOR_FOLLOWERS),
+        object_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(Counter.POST_COMMENTS, instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change(Counter.POST_COMMENTS, instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_page(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    following_cache.invalidate(instance.user_id)
+    cache.bump(user_scope(instance.user_id))
+    if created and not raw:
+        counters.change(Counter.AUTHOR_FOLLOWERS, instance.author_id)
+        timeline.promote(instance.author_id, counters.get_count(
+            Counter.AUTHOR_FOLLOWERS, instance.author_id))
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    following_cache.invalidate(instance.user_id)
+    cache.bump(user_scope(instance.user_id))
+    counters.change(Counter.AUTHOR_FOLLOWERS, instance.author_id, -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.schedule_demote(instance.author_id, counters.get_count(
+        Counter.AUTHOR_FOLLOWERS, instance.author_id))
@@ -0,0 +1,75 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл называется хэшем своего содержимого, поэтому одинаковые загрузки
+ложатся в один файл, а sorl режет для него один набор миниатюр. Сколько
+постов ссылается на файл, считает posts.images: удаляется он вместе с
+последним таким постом.
+
+Файлы раскладываются по подкаталогам из первых символов хэша
+(posts/3f/a2/3fa2….jpg): в одном каталоге не копятся миллионы файлов,
+и поиск, бэкап и обход каталога остаются быстрыми. Старые файлы из
+плоского posts/ переносит команда shard_images.
+"""
+import hashlib
+import os
+import shutil
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+# Уровней подкаталогов и символов хэша на уровень: 2 × 2 дают 65 536
+# каталогов, то есть меньше тысячи файлов в каждом на 50 млн картинок.
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который сохраняет файл под именем
+    <каталог upload_to>/<шарды>/<sha256 содержимого><расширение>."""
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+                  for i in range(SHARD_LEVELS)]
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, *shards, digest + extension)
+
+    def link(self, name, directory):
+        """Кладёт файл name на его место в directory и возвращает новое
+        имя. Сам name остаётся: удалить его можно, только когда база уже
+        ссылается на новое имя. Жёсткая ссылка не копирует данные; если
+        файловая система её не умеет, файл копируется."""
+        with self.open(name) as content:
+            new_name = self.content_name(
+                os.path.join(directory, os.path.basename(name)), content)
+        if new_name == name or self.exists(new_name):
+            return new_name
+        os.makedirs(os.path.dirname(self.path(new_name)), exist_ok=True)
+        try:
+            os.link(self.path(name), self.path(new_name))
+        except FileExistsError:
+            pass
+        except OSError:
+            # Копия под временным именем и rename: недописанный файл
+            # под настоящим именем не появится.
+            temporary = self.path(new_name) + '.part'
+            shutil.copyfile(self.path(name), temporary)
+            os.replace(temporary, self.path(new_name))
+        return new_name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Такой файл уже есть: новая загрузка просто ссылается на него.
+            return name
+        return super().save(name, content, max_length)
@@ -0,0 +1,10 @@
+from django import template
+
+from posts.following import is_following
+
+register = template.Library()
+
+
+@register.filter
+def follows(user, author):
+    return is_following(user, author)
@@ -0,0 +1,63 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from posts import thumbnails
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, show_author, show_group):
+    """Ключ карточки: id поста и хэш всего, что попадает в её HTML.
+
+    Правка поста, смена имени автора или группы дают новый ключ,
+    а старая карточка просто перестаёт читаться.
+    """
+    group = post.group
+    parts = (
+        post.text, post.image.name, bool(post.image_preview),
+        post.pub_date.isoformat(),
+        post.author.username, post.author.get_full_name(),
+        group.slug if group else '', show_author, show_group,
+        get_language(),
+    )
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'posts.card.{post.pk}.{digest}'
+
+
+@register.simple_tag
+def post_cards(posts, show_author=True, show_group=True):
+    """HTML карточек постов страницы: один get_many на всю страницу,
+    рендерятся только карточки, которых нет в кэше, а их миниатюры
+    ищутся одним заходом в kvstore. Карточка, у которой готовы не все
+    варианты миниатюры, не кэшируется.
+
+    {% post_cards page_obj as cards %}{% for card in cards %}...
+    """
+    keys = {card_key(post, show_author, show_group): post for post in posts}
+    cards = cache.get_many(list(keys))
+    thumbnails.prefetch(
+        [post for key, post in keys.items() if key not in cards], 'card')
+    rendered = {}
+    for key, post in keys.items():
+        if key in cards:
+            continue
+        thumbnail = thumbnails.responsive(post.image, 'card')
+        cards[key] = render_to_string(CARD_TEMPLATE, {
+            'post': post,
+            'thumbnail': thumbnail,
+            'show_author': show_author,
+            'show_group': show_group,
+        })
+        if thumbnail is None or thumbnail.complete:
+            rendered[key] = cards[key]
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,15 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(image, alias='card'):
+    """<picture> с srcset по вариантам миниатюры из
+    settings.POST_THUMBNAILS или заглушка того же размера.
+
+    {% post_image post.image %}
+    """
+    return {'im': thumbnails.responsive(image, alias)}
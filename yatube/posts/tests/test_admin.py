@@ -0,0 +1,153 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class PostAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'group-{i}',
+                                 description='Описание')
+            for i in range(3)]
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:posts_post_changelist')
+
+    def create_posts(self, count):
+        for i in range(count):
+            Post.objects.create(
+                text=f'Пост {i}', author=self.authors[i % 3],
+                group=self.groups[i % 3])
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.create_posts(3)
+        _, few = self.changelist_queries()
+        self.create_posts(12)
+        _, many = self.changelist_queries()
+        self.assertEqual(len(few), len(many))
+
+    def test_no_full_table_count(self):
+        self.create_posts(3)
+        response, queries = self.changelist_queries()
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertFalse([sql for sql in queries
+                          if 'COUNT(' in sql and 'posts_post' in sql])
+        response, _ = self.changelist_queries(
+            **{'pub_date__gte': '2000-01-01 00:00:00+00:00'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_search_uses_full_text_index(self):
+        Post.objects.create(text='Мороз и солнце', author=self.authors[0])
+        Post.objects.create(text='Буря мглою', author=self.authors[1])
+        response, queries = self.changelist_queries(q='author1')
+        self.assertEqual(
+            [post.text for post in response.context['cl'].result_list],
+            ['Буря мглою'])
+        self.assertTrue([sql for sql in queries if 'MATCH' in sql])
+        self.assertFalse([sql for sql in queries if 'LIKE' in sql])
+
+    def test_group_editor(self):
+        self.create_posts(3)
+        post = Post.objects.filter(group=self.groups[0]).get()
+        response, _ = self.changelist_queries()
+        self.assertNotContains(response, 'add_id_form-0-group')
+        self.assertContains(response, 'admin-autocomplete')
+        # В каждой строке — только выбранная группа, а не весь список.
+        for group in self.groups:
+            self.assertContains(response, f'>{group.title}</option>', 1)
+        formset = response.context['cl'].formset
+        data = {
+            'form-TOTAL_FORMS': formset.total_form_count(),
+            'form-INITIAL_FORMS': formset.initial_form_count(),
+            '_save': 'Сохранить',
+        }
+        for i, form in enumerate(formset.forms):
+            data[f'form-{i}-id'] = form.instance.pk
+            data[f'form-{i}-group'] = form.instance.group_id
+            if form.instance == post:
+                data[f'form-{i}-group'] = self.groups[2].pk
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        post.refresh_from_db()
+        self.assertEqual(post.group, self.groups[2])
+
+
+class RelatedLookupAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.users = [User.objects.create_user(username=f'reader{i}')
+                     for i in range(3)]
+        cls.group = Group.objects.create(
+            title='Поэзия', slug='poetry', description='Стихи')
+        cls.posts = [
+            Post.objects.create(text=f'Стихотворение {i}',
+                                author=cls.users[i], group=cls.group)
+            for i in range(3)]
+        for i, user in enumerate(cls.users):
+            Follow.objects.create(user=user, author=cls.users[i - 1])
+            Comment.objects.create(
+                text='Комментарий', author=user, post=cls.posts[i - 1])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_change_forms_do_not_list_tables(self):
+        objects = {
+            'post': self.posts[0],
+            'comment': Comment.objects.get(post=self.posts[0]),
+            'follow': Follow.objects.get(user=self.users[1]),
+        }
+        for model, instance in objects.items():
+            with self.subTest(model=model):
+                response = self.client.get(reverse(
+                    f'admin:posts_{model}_change', args=[instance.pk]))
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'admin-autocomplete')
+                # В <select> только текущие значения, а не вся таблица.
+                self.assertNotContains(response, 'reader2">reader2')
+                self.assertNotContains(response, 'Стихотворение 2</option>')
+
+    def test_changelists_load_related_rows_in_bulk(self):
+        for model in ('comment', 'follow'):
+            with self.subTest(model=model):
+                url = reverse(f'admin:posts_{model}_changelist')
+                with CaptureQueriesContext(connection) as before:
+                    self.client.get(url)
+                Follow.objects.create(
+                    user=self.users[0], author=self.users[2])
+                Comment.objects.create(
+                    text='Ещё', author=self.users[0], post=self.posts[0])
+                with CaptureQueriesContext(connection) as after:
+                    self.client.get(url)
+                self.assertEqual(len(before), len(after))
+
+    def test_post_autocomplete_uses_full_text_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_autocomplete'), {'term': 'reader1'})
+        self.assertEqual([result['id'] for result in response.json()[
+            'results']], [str(self.posts[1].pk)])
+        self.assertTrue([query for query in queries
+                         if 'MATCH' in query['sql']])
@@ -0,0 +1,82 @@
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.cache import get_cache_key
+
+from posts.cache import _lock_key, cache_page_coalesced
+
+
+class CoalescedCachePageTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+        @cache_page_coalesced(60, key_prefix='test', stale=60)
+        def view(request):
+            self.calls += 1
+            return HttpResponse(f'render {self.calls}')
+
+        self.view = view
+        self.request = RequestFactory().get('/feed/')
+
+    def test_page_is_rendered_once(self):
+        self.view(self.request)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'render 1')
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(FEED_CACHE_BETA=10 ** 9)
+    def test_locked_early_refresh_serves_previous_copy(self):
+        self.view(self.request)
+        cache.add(_lock_key(self.request, 'test'), 1)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'render 1')
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(FEED_CACHE_BETA=10 ** 9)
+    def test_early_refresh_rerenders_page(self):
+        self.view(self.request)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'render 2')
+
+    @override_settings(FEED_CACHE_WAIT=0.1)
+    def test_miss_waits_for_lock_holder_then_renders(self):
+        cache.add(_lock_key(self.request, 'test'), 1)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'render 1')
+        self.assertTrue(cache.get(_lock_key(self.request, 'test')))
+
+    def expire_entry(self):
+        key = get_cache_key(self.request, 'test', 'GET', cache)
+        response, _, delta = cache.get(key)
+        cache.set(key, (response, time.time() - 1, delta), 60)
+
+    def wait_for_content(self, content):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            response = self.view(self.request)
+            if response.content == content:
+                return response
+            time.sleep(0.05)
+        return response
+
+    def test_stale_page_served_while_revalidating(self):
+        self.view(self.request)
+        self.expire_entry()
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'render 1')
+        response = self.wait_for_content(b'render 2')
+        self.assertEqual(response.content, b'render 2')
+        self.assertEqual(self.calls, 2)
+        self.assertIsNone(cache.get(_lock_key(self.request, 'test')))
+
+    def test_locked_stale_page_is_not_rerendered(self):
+        self.view(self.request)
+        self.expire_entry()
+        cache.add(_lock_key(self.request, 'test'), 1)
+        response = self.view(self.request)
+        self.assertEqual(response.content, b'render 1')
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,66 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts import counters
+from posts.models import Comment, Counter, Group, Post
+
+User = get_user_model()
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Название тестовой группы',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self, author, group, other_group, total):
+        self.assertEqual(counters.get_count(
+            Counter.AUTHOR_POSTS, self.user.pk), author)
+        self.assertEqual(counters.get_count(
+            Counter.GROUP_POSTS, self.group.pk), group)
+        self.assertEqual(counters.get_count(
+            Counter.GROUP_POSTS, self.other_group.pk), other_group)
+        self.assertEqual(counters.get_count(Counter.TOTAL_POSTS), total)
+
+    def test_counters_follow_post_lifecycle(self):
+        post = Post.objects.create(
+            text='Тестовый текст', author=self.user, group=self.group)
+        Post.objects.create(text='Без группы', author=self.user)
+        self.assertCounters(2, 1, 0, 2)
+        post.group = self.other_group
+        post.save()
+        self.assertCounters(2, 0, 1, 2)
+        post.delete()
+        self.assertCounters(1, 0, 0, 1)
+
+    def test_comment_counter(self):
+        post = Post.objects.create(text='Тестовый текст', author=self.user)
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Комментарий')
+        Comment.objects.create(post=post, author=self.user, text='Ещё')
+        self.assertEqual(
+            counters.get_count(Counter.POST_COMMENTS, post.pk), 2)
+        comment.delete()
+        self.assertEqual(
+            counters.get_count(Counter.POST_COMMENTS, post.pk), 1)
+
+    def test_rebuild_command_fixes_bulk_created_posts(self):
+        Post.objects.create(text='Тестовый текст', author=self.user)
+        Post.objects.bulk_create([
+            Post(text=f'Пост {i}', author=self.user, group=self.group)
+            for i in range(3)])
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCounters(4, 3, 0, 4)
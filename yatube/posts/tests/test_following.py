@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.template import Context, Template
+from django.test import TestCase
+
+from posts.following import FollowingCache, following_cache, is_following
+from posts.models import Follow
+
+User = get_user_model()
+
+
+class FollowingCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        following_cache.clear()
+
+    def test_follow_signals_invalidate_cache(self):
+        self.assertFalse(is_following(self.reader, self.author))
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(is_following(self.reader, self.author))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_following(self.reader, self.author))
+        follow.delete()
+        self.assertFalse(is_following(self.reader, self.author))
+
+    def test_other_processes_see_changes(self):
+        worker = FollowingCache(max_users=10)
+        self.assertEqual(list(worker.get(self.reader.pk)), [])
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(list(worker.get(self.reader.pk)), [self.author.pk])
+        follow.delete()
+        self.assertEqual(list(worker.get(self.reader.pk)), [])
+
+    def test_entries_expire(self):
+        worker = FollowingCache(max_users=10, timeout=0)
+        worker.get(self.reader.pk)
+        with self.assertNumQueries(1):
+            worker.get(self.reader.pk)
+
+    def test_cache_is_bounded(self):
+        cache = FollowingCache(max_users=1)
+        cache.get(self.reader.pk)
+        cache.get(self.author.pk)
+        self.assertEqual(list(cache._data), [self.author.pk])
+
+    def test_follows_filter(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        template = Template(
+            '{% load follow_filters %}{% if reader|follows:author %}yes'
+            '{% endif %}')
+        rendered = template.render(Context({
+            'reader': self.reader, 'author': self.author}))
+        self.assertEqual(rendered, 'yes')
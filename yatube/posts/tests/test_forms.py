@@ -64,7 +64,11 @@ class PostCreateFormTests(TestCase):
         form_data = {
             'text': 'Тестовый текст',
             'group': self.group.id,
-            'image': self.uploaded,
+            'image': SimpleUploadedFile(
+                name='new.gif',
+                content=self.small_gif,
+                content_type='image/gif'
+            ),
         }
 
         response = self.authorized_client.post(
@@ -79,7 +83,8 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 text='Тестовый текст',
                 group=self.group.id,
-                image='posts/small.gif',
+                # Та же картинка ложится в тот же файл.
+                image=self.post.image.name,
             ).exists()
         )
 
@@ -0,0 +1,166 @@
+import os
+import re
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+
+from posts import images
+from posts.models import Post, StoredImage
+from posts.storage import ContentAddressedStorage
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class ContentAddressedImageTests(TransactionTestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        # Миниатюры здесь не нужны, а пул писал бы в kvstore из другого
+        # потока параллельно с тестом.
+        patcher = mock.patch('posts.thumbnails.schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.user = User.objects.create_user(username='author')
+
+    def create_post(self, name, content=SMALL_GIF):
+        return Post.objects.create(
+            text='Пост', author=self.user,
+            image=SimpleUploadedFile(name, content, content_type='image/gif'))
+
+    def references(self, name):
+        return StoredImage.objects.get(name=name).references
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_post('meme.gif')
+        second = self.create_post('copy-of-meme.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name, r'^posts/([0-9a-f]{2})/([0-9a-f]{2})/\1\2')
+        self.assertEqual(len(first.image.storage.listdir(
+            os.path.dirname(first.image.name))[1]), 1)
+        self.assertEqual(self.references(first.image.name), 2)
+
+    def test_file_is_deleted_with_last_reference(self):
+        first = self.create_post('meme.gif')
+        second = self.create_post('meme.gif')
+        name, storage = first.image.name, first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(self.references(name), 1)
+        second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+
+    def test_file_acquired_before_cleanup_is_kept(self):
+        post = self.create_post('meme.gif')
+        name, storage = post.image.name, post.image.storage
+        # Удаление поста и новая ссылка на тот же файл из параллельной
+        # транзакции, которая закоммитится позже очистки.
+        with mock.patch.object(images.transaction, 'on_commit'):
+            post.delete()
+        images.acquire(name)
+        images._delete_unused(name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(self.references(name), 1)
+
+    def test_acquire_restores_file_deleted_meanwhile(self):
+        name = self.create_post('meme.gif').image.name
+        save = ContentAddressedStorage.save
+        lost = []
+
+        def save_then_lose(storage, *args, **kwargs):
+            # Хранилище нашло файл, а очистка удалила его до acquire.
+            saved = save(storage, *args, **kwargs)
+            if not lost:
+                storage.delete(saved)
+                lost.append(saved)
+            return saved
+
+        with mock.patch.object(ContentAddressedStorage, 'save',
+                               save_then_lose):
+            post = self.create_post('copy.gif')
+        self.assertEqual(post.image.name, name)
+        self.assertTrue(post.image.storage.exists(name))
+        with post.image.storage.open(name) as file:
+            self.assertEqual(file.read(), SMALL_GIF)
+
+    def test_replaced_image_is_released(self):
+        post = self.create_post('meme.gif')
+        old_name = post.image.name
+        post.image = SimpleUploadedFile(
+            'other.gif', SMALL_GIF + b'\x00', content_type='image/gif')
+        post.save()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertFalse(post.image.storage.exists(old_name))
+        self.assertEqual(self.references(post.image.name), 1)
+        post.text = 'Правка без новой картинки'
+        post.save()
+        self.assertEqual(self.references(post.image.name), 1)
+
+    def test_shard_images_moves_flat_files(self):
+        flat = FileSystemStorage()
+        flat.save('posts/meme.gif', ContentFile(SMALL_GIF))
+        flat.save('posts/copy.gif', ContentFile(SMALL_GIF))
+        flat.save('posts/other.gif', ContentFile(SMALL_GIF + b'\x00'))
+        posts = [
+            Post.objects.create(text='Пост', author=self.user, image=name)
+            for name in ('posts/meme.gif', 'posts/copy.gif',
+                         'posts/meme.gif', 'posts/other.gif')]
+        sharded = self.create_post('new.gif', SMALL_GIF + b'\x01')
+        call_command('shard_images', batch_size=2, skip_thumbnails=True,
+                     stdout=StringIO())
+        names = [Post.objects.get(pk=post.pk).image.name for post in posts]
+        for name in names:
+            self.assertRegex(name, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/')
+            self.assertTrue(flat.exists(name))
+        self.assertEqual(names[0], names[1])
+        self.assertEqual(names[0], names[2])
+        self.assertNotEqual(names[0], names[3])
+        self.assertEqual(flat.listdir('posts')[1], [])
+        self.assertEqual(self.references(names[0]), 3)
+        self.assertEqual(self.references(names[3]), 1)
+        self.assertFalse(StoredImage.objects.filter(
+            name__in=['posts/meme.gif', 'posts/copy.gif']).exists())
+        sharded.refresh_from_db()
+        self.assertTrue(re.match(r'posts/../../', sharded.image.name))
+
+    def test_shard_images_keeps_files_until_commit(self):
+        flat = FileSystemStorage()
+        flat.save('posts/meme.gif', ContentFile(SMALL_GIF))
+        post = Post.objects.create(
+            text='Пост', author=self.user, image='posts/meme.gif')
+        with mock.patch('posts.images.recount', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command('shard_images', skip_thumbnails=True,
+                             stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, 'posts/meme.gif')
+        self.assertTrue(flat.exists('posts/meme.gif'))
+        call_command('shard_images', skip_thumbnails=True, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(flat.exists(post.image.name))
+        self.assertFalse(flat.exists('posts/meme.gif'))
@@ -1,6 +1,7 @@
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.core.cache import cache
 
 from posts.models import Group, Post
 
@@ -29,6 +30,7 @@ class PaginatorViewsTest(TestCase):
             for i in range(1, 13)])
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -66,3 +68,49 @@ class PaginatorViewsTest(TestCase):
         response = self.client.get(reverse('posts:profile', kwargs={
             'username': 'HasNoName'}) + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_index_next_cursor_continues_feed(self):
+        first_page = self.client.get(reverse('posts:index'))
+        cursor = first_page.context['page_obj'].next_cursor
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={cursor}')
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 3)
+        self.assertIsNone(page_obj.next_cursor)
+        seen = {post.pk for post in first_page.context['page_obj']}
+        self.assertFalse(seen & {post.pk for post in page_obj})
+
+    def test_profile_previous_cursor_returns_first_page(self):
+        url = reverse('posts:profile', kwargs={'username': 'HasNoName'})
+        first_page = self.client.get(url).context['page_obj']
+        second_page = self.client.get(
+            url + f'?cursor={first_page.next_cursor}').context['page_obj']
+        response = self.client.get(
+            url + f'?cursor={second_page.previous_cursor}')
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [post.pk for post in first_page])
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        response = self.client.get(
+            reverse('posts:group_name', kwargs={'slug': 'test-slug'})
+            + '?cursor=not-a-cursor')
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_out_of_range_page_redirects_to_first(self):
+        url = reverse('posts:group_name', kwargs={'slug': 'test-slug'})
+        for page in ('3', '100500', 'abc', '0'):
+            with self.subTest(page=page):
+                response = self.client.get(url + f'?page={page}')
+                self.assertRedirects(response, url)
+
+    def test_page_window_is_bounded(self):
+        Post.objects.bulk_create([
+            Post(text=f'Ещё пост {i}', author=self.user)
+            for i in range(60)])
+        response = self.client.get(reverse('posts:profile', kwargs={
+            'username': 'HasNoName'}) + '?page=4')
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj.page_window), [2, 3, 4, 5, 6])
+        self.assertTrue(page_obj.more_pages)
@@ -0,0 +1,113 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from posts import search
+from posts.models import Group, Post
+from posts.views import PAGE_PER_LIST
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='pushkin')
+        cls.group = Group.objects.create(
+            title='Поэзия', slug='poetry', description='Стихи')
+        cls.in_text = Post.objects.create(
+            text='Мороз и солнце; день чудесный!', author=cls.author)
+        cls.in_group = Post.objects.create(
+            text='Ещё ты дремлешь, друг прелестный', author=cls.author,
+            group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query, **kwargs):
+        return search.search(query, **kwargs)[0]
+
+    def test_match_expression_drops_syntax(self):
+        self.assertEqual(search.match_expression('Мороз AND "солнце*'),
+                         '"мороз" "and" "солнце"*')
+        self.assertIsNone(search.match_expression(' *"() '))
+
+    def test_text_group_and_author(self):
+        self.assertEqual(self.found('мороз солн'), [self.in_text])
+        self.assertEqual(self.found('поэзия'), [self.in_group])
+        self.assertEqual(self.found('pushkin'),
+                         [self.in_text, self.in_group])
+        self.assertEqual(self.found('мороз дремлешь'), [])
+        self.assertEqual(self.found('мор солнце'), [])
+
+    def test_text_match_ranks_first(self):
+        post = Post.objects.create(text='О поэзии и прозе', author=self.author)
+        self.assertEqual(self.found('поэз')[0], post)
+
+    def test_index_follows_changes(self):
+        # Свежие копии: объекты setUpTestData общие для всех тестов.
+        post = Post.objects.get(pk=self.in_text.pk)
+        post.text = 'Буря мглою небо кроет'
+        post.save()
+        self.assertEqual(self.found('мороз'), [])
+        self.assertEqual(self.found('буря'), [post])
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Лирика'
+        group.save()
+        self.assertEqual(self.found('лирика'), [self.in_group])
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'alexander'
+        author.save()
+        self.assertEqual(len(self.found('alexander')), 2)
+        Post.objects.filter(pk=self.in_group.pk).delete()
+        self.assertEqual(self.found('лирика'), [])
+
+    def test_bulk_created_posts_are_indexed(self):
+        Post.objects.bulk_create(
+            Post(text=f'Зимнее утро {i}', author=self.author)
+            for i in range(PAGE_PER_LIST + 1))
+        first, has_next = search.search('зимнее', per_page=PAGE_PER_LIST)
+        self.assertEqual(len(first), PAGE_PER_LIST)
+        self.assertTrue(has_next)
+        second, has_next = search.search(
+            'зимнее', page=2, per_page=PAGE_PER_LIST)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(has_next)
+        self.assertFalse(set(first) & set(second))
+
+    def test_view(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'Мороз'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts'], [self.in_text])
+        self.assertContains(response, 'день чудесный')
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'мороз', 'page': 'x'})
+        self.assertEqual(response.context['page'], 1)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+        self.assertEqual(self.found('мороз'), [])
+        out = StringIO()
+        call_command('rebuild_search', chunk_size=1, stdout=out)
+        self.assertIn('Проиндексировано постов: 2', out.getvalue())
+        self.assertEqual(self.found('мороз'), [self.in_text])
+
+    def test_rebuild_survives_concurrent_edits(self):
+        def edit_next_chunk(done, last, total):
+            # Правка поста из следующей пачки: триггер вставит его строку
+            # раньше, чем до неё дойдёт rebuild().
+            if done == self.in_text.pk:
+                Post.objects.filter(pk=self.in_group.pk).update(
+                    text='Буря мглою небо кроет')
+
+        self.assertEqual(
+            search.rebuild(chunk_size=1, progress=edit_next_chunk), 2)
+        self.assertEqual(self.found('буря'), [self.in_group])
+        self.assertEqual(self.found('дремлешь'), [])
@@ -0,0 +1,240 @@
+import shutil
+import tempfile
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.template import Context, Template
+from PIL import Image, features
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def gif(name, color):
+    """Маленькая картинка; разный цвет — разное содержимое и файл."""
+    buffer = BytesIO()
+    Image.new('RGB', (2, 1), color).save(buffer, 'GIF')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/gif')
+
+
+class FakeExecutor:
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, fn, args))
+        return future
+
+    def run(self):
+        for future, fn, args in self.jobs:
+            future.set_result(fn(*args))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.user,
+                image=gif(f'small{i}.gif', (i * 100, 0, 0)))
+            for i in range(2)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.executor = FakeExecutor()
+        patcher = mock.patch.object(
+            thumbnails, '_get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(thumbnails._pending.clear)
+
+    def test_missing_thumbnail_is_placeholder(self):
+        placeholder = thumbnails.get(self.posts[0].image, 'card')
+        self.assertIsInstance(placeholder, thumbnails.Placeholder)
+        self.assertIsNone(placeholder.url)
+        self.assertEqual((placeholder.width, placeholder.height), (960, 339))
+
+    def test_placeholder_carries_preview(self):
+        post = self.posts[1]
+        self.assertEqual(post.image_color, '#640000')
+        html = Template(
+            '{% load post_thumbnails %}{% post_image image %}').render(
+            Context({'image': post.image}))
+        self.assertIn(f'background: #640000 url({post.image_preview})', html)
+
+    def test_generated_thumbnail_is_served(self):
+        image = self.posts[0].image
+        thumbnails.generate(image)
+        thumbnail = thumbnails.get(image, 'card')
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        self.assertTrue(thumbnail.exists())
+        self.assertFalse(thumbnails.schedule(image))
+
+    @override_settings(POST_THUMBNAIL_QUEUE=1)
+    def test_queue_is_bounded_and_deduplicated(self):
+        first, second = (post.image for post in self.posts)
+        self.assertTrue(thumbnails.schedule(first))
+        self.assertFalse(thumbnails.schedule(first))
+        self.assertFalse(thumbnails.schedule(second))
+        self.executor.run()
+        self.assertIsNotNone(thumbnails.get(first, 'card').url)
+        self.assertTrue(thumbnails.schedule(second))
+
+    def test_finished_thumbnails_refresh_index(self):
+        for post in self.posts:
+            thumbnails.schedule(post.image)
+        self.assertNotContains(self.client.get('/'), '<picture')
+        self.executor.run()
+        for url in ('/', '/profile/author/'):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), '<picture')
+
+    def test_removed_image_is_skipped(self):
+        image = self.posts[1].image
+        thumbnails.schedule(image)
+        image.storage.delete(image.name)
+        self.executor.run()
+        self.assertFalse(thumbnails._pending)
+        self.assertIsInstance(
+            thumbnails.get(image, 'card'), thumbnails.Placeholder)
+
+    @override_settings(POST_THUMBNAIL_WIDTHS=(), POST_THUMBNAIL_FORMATS=())
+    def test_prefetch_reads_page_in_one_go(self):
+        thumbnails.generate(self.posts[0].image)
+        cache.clear()
+        posts = list(Post.objects.filter(
+            pk__in=[post.pk for post in self.posts]).order_by('pk'))
+        with self.assertNumQueries(1):
+            self.assertEqual(thumbnails.prefetch(posts, 'card'), 2)
+        with self.assertNumQueries(0):
+            ready = thumbnails.get(posts[0].image, 'card')
+            missing = thumbnails.get(posts[1].image, 'card')
+        self.assertIsNotNone(ready.url)
+        self.assertIsInstance(missing, thumbnails.Placeholder)
+        with self.assertNumQueries(0):
+            self.assertEqual(thumbnails.prefetch(posts, 'card'), 1)
+
+    @override_settings(POST_THUMBNAIL_WIDTHS=(320, 480, 2000),
+                       POST_THUMBNAIL_FORMATS=('PNG', 'NOSUCHFORMAT'))
+    def test_variants(self):
+        self.assertEqual(
+            {name: (variant.geometry, variant.format)
+             for name, variant in thumbnails.variants('card').items()},
+            {'card@320': ('320x113', None), 'card@480': ('480x170', None),
+             'card': ('960x339', None),
+             'card@320.png': ('320x113', 'PNG'),
+             'card@480.png': ('480x170', 'PNG'),
+             'card@960.png': ('960x339', 'PNG')})
+
+    @override_settings(POST_THUMBNAIL_WIDTHS=(480,),
+                       POST_THUMBNAIL_FORMATS=('PNG',))
+    def test_responsive_srcset(self):
+        image = self.posts[0].image
+        thumbnails.generate(image)
+        html = Template(
+            '{% load post_thumbnails %}{% post_image image %}').render(
+            Context({'image': image}))
+        responsive = thumbnails.responsive(image)
+        self.assertTrue(responsive.complete)
+        self.assertEqual(responsive.srcset.count(' 480w'), 1)
+        self.assertEqual(responsive.srcset.count(' 960w'), 1)
+        [(mime, srcset)] = responsive.sources
+        self.assertEqual(mime, 'image/png')
+        self.assertIn('.png 480w', srcset)
+        self.assertIn('<source type="image/png"', html)
+        self.assertIn(f'srcset="{responsive.srcset}"', html)
+        self.assertIn('width="960" height="339" loading="lazy"', html)
+
+    @override_settings(POST_THUMBNAIL_WIDTHS=(480,))
+    def test_missing_variant_is_scheduled(self):
+        image = self.posts[0].image
+        with override_settings(POST_THUMBNAIL_WIDTHS=()):
+            thumbnails.generate(image)
+        # В TestCase транзакция не коммитится: зовём колбэк сразу.
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               side_effect=lambda callback: callback()):
+            responsive = thumbnails.responsive(image)
+        self.assertFalse(responsive.complete)
+        self.assertIn(image.name, thumbnails._pending)
+
+    @skipUnless(features.check('webp'), 'Pillow без WebP')
+    def test_webp_variants(self):
+        image = self.posts[1].image
+        thumbnails.generate(image)
+        self.assertIn('image/webp', dict(
+            thumbnails.responsive(image).sources))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsCommandTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.user,
+            image=gif('command.gif', (0, 0, 255)))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_builds_missing_thumbnails(self):
+        out = StringIO()
+        call_command('thumbnails', 'warm', workers=1, stdout=out)
+        self.assertIn('1/1 постов, нарезано 1', out.getvalue())
+        self.assertIsNotNone(thumbnails.get(self.post.image, 'card').url)
+        call_command('thumbnails', 'warm', workers=1, stdout=out)
+        self.assertIn('1/1 постов, нарезано 0', out.getvalue())
+
+    def test_previews_fills_missing(self):
+        Post.objects.filter(pk=self.post.pk).update(
+            image_color='', image_preview='')
+        call_command('thumbnails', 'previews', workers=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_color, '#0000ff')
+        self.assertTrue(self.post.image_preview.startswith('data:'))
+
+    def test_purge_removes_orphans(self):
+        thumbnails.generate(self.post.image)
+        old = Post.objects.create(
+            text='Старый', author=self.user,
+            image=gif('old.gif', (0, 255, 0)))
+        thumbnails.generate(old.image)
+        orphans = thumbnails.thumbnail_names(old.image.name)
+        old.delete()
+        call_command('thumbnails', 'purge', stdout=StringIO())
+        for name in orphans:
+            self.assertFalse(default.storage.exists(name))
+        for name in thumbnails.thumbnail_names(self.post.image.name):
+            self.assertTrue(default.storage.exists(name))
+        self.assertIsNone(default.kvstore.get(
+            thumbnails._thumbnail_file(old.image.name, 'card')))
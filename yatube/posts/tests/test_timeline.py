@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import timeline
+from posts.models import Follow, Post, PulledAuthor, TimelineEntry
+
+User = get_user_model()
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=2, FEED_FANOUT_MIN_FOLLOWERS=1)
+class HybridTimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.star = User.objects.create_user(username='star')
+        cls.regular = User.objects.create_user(username='regular')
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        Follow.objects.create(user=cls.reader, author=cls.regular)
+        for name in ('fan', 'superfan'):
+            fan = User.objects.create_user(username=name)
+            Follow.objects.create(user=fan, author=cls.star)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed(self, query=''):
+        response = self.client.get(reverse('posts:follow_index') + query)
+        return response.context['page_obj']
+
+    def test_popular_author_is_not_fanned_out(self):
+        Post.objects.create(text='Пост звезды', author=self.star)
+        Post.objects.create(text='Обычный пост', author=self.regular)
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list(
+                'author__username', flat=True)),
+            ['regular'])
+
+    def test_feed_merges_pushed_and_pulled_posts(self):
+        posts = [
+            Post.objects.create(text=f'Пост {i}',
+                                author=(self.star, self.regular)[i % 2])
+            for i in range(13)]
+        first_page = self.feed()
+        self.assertEqual([post.pk for post in first_page],
+                         [post.pk for post in posts[:2:-1]])
+        second_page = self.feed(f'?cursor={first_page.next_cursor}')
+        self.assertEqual([post.pk for post in second_page],
+                         [post.pk for post in posts[2::-1]])
+        self.assertEqual(len(self.feed('?page=2')), 3)
+
+    def unfollow(self, username):
+        # В TestCase транзакция не коммитится, а поток не видел бы её
+        # данных: возврат на push выполняем сразу и здесь же.
+        with mock.patch.object(timeline.transaction, 'on_commit',
+                               side_effect=lambda callback: callback()), \
+                mock.patch.object(timeline, '_demote_in_background',
+                                  side_effect=timeline.demote) as demote:
+            Follow.objects.filter(
+                author=self.star, user__username=username).delete()
+        return demote
+
+    def test_author_dropping_below_limit_is_pushed_again(self):
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        self.unfollow('fan').assert_not_called()
+        self.unfollow('superfan').assert_called_once_with(self.star.pk)
+        self.assertFalse(timeline.is_pulled(self.star.pk))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+
+    def test_mode_does_not_flap_between_limits(self):
+        since = timeline.pulled_since(self.star.pk)
+        self.unfollow('fan').assert_not_called()
+        fan = User.objects.get(username='fan')
+        Follow.objects.create(user=fan, author=self.star)
+        self.assertEqual(timeline.pulled_since(self.star.pk), since)
+
+    def test_new_follower_gets_posts_before_pull(self):
+        rising = User.objects.create_user(username='rising')
+        old_post = Post.objects.create(text='Старый пост', author=rising)
+        for user in User.objects.exclude(pk=rising.pk)[:3]:
+            Follow.objects.create(user=user, author=rising)
+        self.assertTrue(PulledAuthor.objects.filter(author=rising).exists())
+        Post.objects.create(text='Новый пост', author=rising)
+        newcomer = User.objects.create_user(username='newcomer')
+        Follow.objects.create(user=newcomer, author=rising)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(
+                user=newcomer).values_list('post', flat=True)),
+            [old_post.pk])
@@ -0,0 +1,172 @@
+import struct
+import zlib
+from io import BytesIO
+from unittest import mock
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from posts import uploads
+from posts.forms import PostForm
+
+
+def jpeg(size, orientation=None):
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[0x010F] = 'Phone'
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=100, exif=exif.tobytes())
+    return SimpleUploadedFile('photo.JPG', buffer.getvalue(),
+                              content_type='image/jpeg')
+
+
+def png(size):
+    exif = Image.Exif()
+    exif[0x0110] = 'SecretCam'
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG', exif=exif.tobytes())
+    return SimpleUploadedFile('photo.png', buffer.getvalue(),
+                              content_type='image/png')
+
+
+def png_header(width, height):
+    """PNG 1×1, в заголовке которого записаны другие размеры: Pillow
+    поверит заголовку, пока не начнёт декодировать."""
+    buffer = BytesIO()
+    Image.new('L', (1, 1)).save(buffer, 'PNG')
+    data = buffer.getvalue()
+    ihdr = b'IHDR' + struct.pack('>II', width, height) + data[24:29]
+    ihdr += struct.pack('>I', zlib.crc32(ihdr))
+    return SimpleUploadedFile('bomb.png', data[:12] + ihdr + data[33:],
+                              content_type='image/png')
+
+
+class CheckTests(SimpleTestCase):
+
+    def assertRejected(self, upload, code):
+        with self.assertRaises(ValidationError) as context:
+            uploads.check(upload)
+        self.assertEqual(context.exception.code, code)
+        self.assertEqual(upload.tell(), 0)
+
+    def test_decompression_bomb(self):
+        self.assertRejected(png_header(50000, 50000), 'too_many_pixels')
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=10 ** 6,
+                       POST_IMAGE_MAX_DIMENSION=2000)
+    def test_limits(self):
+        self.assertRejected(png_header(1001, 1000), 'too_many_pixels')
+        self.assertRejected(png_header(2001, 10), 'too_many_pixels')
+        uploads.check(png_header(1000, 1000))
+
+    def test_format(self):
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'BMP')
+        self.assertRejected(
+            SimpleUploadedFile('image.bmp', buffer.getvalue()),
+            'invalid_format')
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_upload_size(self):
+        self.assertRejected(jpeg((50, 50)), 'file_too_large')
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=10)
+    def test_handler_stops_writing_at_limit(self):
+        handler = uploads.LimitedTemporaryFileUploadHandler()
+        handler.new_file('image', 'big.png', 'image/png', None)
+        for start in range(0, 16, 4):
+            handler.receive_data_chunk(b'x' * 4, start)
+        file = handler.file_complete(16)
+        self.addCleanup(file.close)
+        self.assertTrue(file.oversized)
+        self.assertEqual(file.size, 16)
+        file.seek(0)
+        self.assertEqual(len(file.read()), 8)
+
+    def test_form_rejects_bomb_before_decoding(self):
+        form = PostForm({'text': 'Пост'}, {'image': png_header(20000, 100)})
+        with mock.patch.object(uploads, 'normalize') as normalize:
+            self.assertFalse(form.is_valid())
+        normalize.assert_not_called()
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'too_many_pixels')
+
+    def test_form_checks_header_before_field_opens_image(self):
+        form = PostForm({'text': 'Пост'}, {'image': png_header(50000, 50000)})
+        self.assertIs(type(form.fields['image']), forms.ImageField)
+        with mock.patch.object(Image, 'open', wraps=Image.open) as image_open:
+            self.assertFalse(form.is_valid())
+        self.assertEqual(image_open.call_count, 1)
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'too_many_pixels')
+
+
+@override_settings(POST_IMAGE_MAX_SIZE=(400, 300), POST_IMAGE_QUALITY=80)
+class NormalizeTests(SimpleTestCase):
+
+    def open(self, upload):
+        upload.seek(0)
+        return Image.open(BytesIO(upload.read()))
+
+    def test_large_photo_is_downscaled_and_stripped(self):
+        upload = jpeg((1600, 800))
+        saved = uploads.stats['saved']
+        result = uploads.normalize(upload)
+        image = self.open(result)
+        self.assertEqual(image.size, (400, 200))
+        self.assertEqual(image.format, 'JPEG')
+        self.assertNotIn('exif', image.info)
+        self.assertEqual(result.name, 'photo.JPG')
+        self.assertLess(result.size, upload.size)
+        self.assertEqual(uploads.stats['saved'] - saved,
+                         upload.size - result.size)
+
+    def test_png_metadata_is_stripped(self):
+        for size in ((1600, 800), (200, 100)):
+            with self.subTest(size=size):
+                upload = png(size)
+                self.assertIn('exif', self.open(upload).info)
+                result = uploads.normalize(upload)
+                self.assertIsNot(result, upload)
+                image = self.open(result)
+                self.assertEqual(image.format, 'PNG')
+                self.assertNotIn('exif', image.info)
+                result.seek(0)
+                self.assertNotIn(b'SecretCam', result.read())
+
+    def test_orientation_is_applied(self):
+        # 6 — повернуть на 90°: ширина и высота меняются местами.
+        image = self.open(uploads.normalize(jpeg((200, 100), orientation=6)))
+        self.assertEqual(image.size, (100, 200))
+        self.assertNotIn('exif', image.info)
+
+    def test_small_clean_image_is_kept(self):
+        buffer = BytesIO()
+        Image.new('RGB', (2, 1), 'red').save(buffer, 'GIF')
+        upload = SimpleUploadedFile('tiny.gif', buffer.getvalue(),
+                                    content_type='image/gif')
+        self.assertIs(uploads.normalize(upload), upload)
+
+    @override_settings(POST_IMAGE_NORMALIZE=False)
+    def test_can_be_disabled(self):
+        upload = jpeg((1600, 800))
+        self.assertIs(uploads.normalize(upload), upload)
+
+    def test_preview(self):
+        upload = jpeg((1600, 800))
+        color, preview = uploads.preview(upload)
+        self.assertEqual(color, '#fe0000')
+        self.assertTrue(preview.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(preview), 1000)
+        self.assertEqual(upload.tell(), 0)
+
+    def test_form_normalizes_upload(self):
+        form = PostForm({'text': 'Пост'}, {'image': jpeg((1600, 800))})
+        self.assertTrue(form.is_valid(), form.errors)
+        image = self.open(form.cleaned_data['image'])
+        self.assertEqual(image.size, (400, 200))
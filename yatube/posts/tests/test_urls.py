@@ -3,6 +3,7 @@ from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from posts.models import Group, Post
 from django.http import HttpResponseNotFound
+from django.core.cache import cache
 
 
 User = get_user_model()
@@ -34,6 +35,7 @@ class PostURLTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
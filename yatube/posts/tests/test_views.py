@@ -9,7 +9,10 @@ from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.core.cache import cache
+from django.template import Context, Template
 
+from posts import cache as page_cache
+from posts import thumbnails
 from posts.models import Group, Post, Follow
 
 User = get_user_model()
@@ -99,7 +102,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(post_text_0, 'Тестовый текст')
         self.assertEqual(post_author_0, 'HasNoName')
         self.assertEqual(post_group_0, 'Название тестовой группы')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.post.image.name)
 
     def test_group_list_page_show_correct_context(self):
         '''Шаблон group_list сформирован с правильным контекстом.'''
@@ -113,7 +116,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(post_text_0, 'Тестовый текст')
         self.assertEqual(post_author_0, 'HasNoName')
         self.assertEqual(post_group_0, 'Название тестовой группы')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.post.image.name)
 
     def test_profile_page_show_correct_context(self):
         '''Шаблон profile сформирован с правильным контекстом.'''
@@ -127,7 +130,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(post_text_0, 'Тестовый текст')
         self.assertEqual(post_author_0, 'HasNoName')
         self.assertEqual(post_group_0, 'Название тестовой группы')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.post.image.name)
 
     def test_post_detail_page_show_correct_context(self):
         '''Шаблон post_detail сформирован с правильным контекстом.'''
@@ -140,7 +143,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(response.context.get(
             'post_number').group.title, 'Название тестовой группы')
         self.assertEqual(
-            response.context.get('post_number').image, 'posts/small.gif')
+            response.context.get('post_number').image, self.post.image.name)
 
     def test_post_create_page_show_correct_context(self):
         '''Шаблон post_create сформирован с правильным контекстом.'''
@@ -168,15 +171,78 @@ class PostPagesTests(TestCase):
     def test_cache(self):
         response = self.guest_client.get(reverse('posts:index'))
         initial_response = response.content
-        post = Post.objects.get(pk=1)
-        post.delete()
-        response_after_delete = self.guest_client.get(reverse('posts:index'))
-        response_cached = response_after_delete.content
-        self.assertTrue(initial_response == response_cached)
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        response_cached = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(initial_response, response_cached.content)
         cache.clear()
-        response_after_delete = self.guest_client.get(reverse('posts:index'))
-        response_cached = response_after_delete.content
-        self.assertTrue(initial_response != response_cached)
+        response_after_clear = self.guest_client.get(reverse('posts:index'))
+        self.assertNotEqual(initial_response, response_after_clear.content)
+
+    def test_cache_is_invalidated_by_post_changes(self):
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_name', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'HasNoName'}),
+        )
+        for url in pages:
+            self.guest_client.get(url)
+        post = Post.objects.create(
+            text='Новый пост', author=self.user, group=self.group)
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Новый пост')
+        post.delete()
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertNotContains(response, 'Новый пост')
+
+    def test_cache_is_invalidated_by_author_rename(self):
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_name', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'HasNoName'}),
+        )
+        for url in pages:
+            self.guest_client.get(url)
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name, author.last_name = 'Лев', 'Толстой'
+        author.save()
+        for url in pages:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Лев Толстой')
+
+    def test_login_keeps_cached_pages(self):
+        scopes = [page_cache.FEED, 'author:HasNoName', 'group:test-slug']
+        versions = page_cache.get_versions(scopes)
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(page_cache.get_versions(scopes), versions)
+
+    def test_cached_pages_are_not_shared_between_users(self):
+        alice = Client()
+        alice.force_login(User.objects.create_user(username='alice'))
+        bob = Client()
+        bob.force_login(User.objects.create_user(username='bob'))
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_name', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'HasNoName'}),
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                self.assertContains(alice.get(url), 'Пользователь: alice')
+                self.assertNotContains(
+                    self.guest_client.get(url), 'Пользователь:')
+                self.assertContains(bob.get(url), 'Пользователь: bob')
+
+    def test_browsers_revalidate_feed_pages(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Expires'))
+        self.assertEqual(
+            set(response['Cache-Control'].split(', ')),
+            {'private', 'no-cache', 'max-age=0'})
 
     def test_follow_new_post_show_up(self):
         follower = User.objects.create_user(username='AnotherUser')
@@ -206,3 +272,34 @@ class PostPagesTests(TestCase):
         self.assertEqual(Follow.objects.count(), follows_count + 1)
         subscribtion.delete()
         self.assertEqual(len(response.context["page_obj"]), 0)
+
+    def test_follow_index_reads_materialized_timeline(self):
+        follower = User.objects.create_user(username='AnotherUser')
+        client = Client()
+        client.force_login(follower)
+        client.get(reverse('posts:profile_follow', kwargs={
+            'username': self.user.username}))
+        new_post = Post.objects.create(text='Свежий пост', author=self.user)
+        self.assertEqual(
+            set(follower.timeline.values_list('post_id', flat=True)),
+            {self.post.pk, new_post.pk})
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [new_post.pk, self.post.pk])
+        client.get(reverse('posts:profile_unfollow', kwargs={
+            'username': self.user.username}))
+        self.assertFalse(follower.timeline.exists())
+
+    def test_post_cards_are_rendered_once(self):
+        thumbnails.generate(self.post.image)
+        template = Template(
+            '{% load post_cards %}{% post_cards posts as cards %}'
+            '{% for card in cards %}{{ card }}{% endfor %}')
+        context = Context({'posts': [self.post]})
+        first = template.render(context)
+        with self.assertTemplateNotUsed('posts/includes/post_card.html'):
+            self.assertEqual(template.render(context), first)
+        self.post.text = 'Исправленный текст'
+        with self.assertTemplateUsed('posts/includes/post_card.html'):
+            self.assertIn('Исправленный текст', template.render(context))
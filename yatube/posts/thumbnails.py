@@ -0,0 +1,427 @@
+"""Миниатюры картинок постов: готовятся заранее, вне запроса.
+
+Раньше {% thumbnail %} в шаблонах создавал миниатюру при первом показе
+страницы, и холодная лента могла секундами стоять в Pillow. Теперь все
+размеры из settings.POST_THUMBNAILS режутся после сохранения поста в
+ограниченном пуле процессов (см. schedule), а шаблон, не найдя готовой
+миниатюры в kvstore sorl, рисует заглушку того же размера.
+
+В дочернем процессе только тяжёлая часть — чтение исходника, ресайз и
+запись файлов; в kvstore результат записывает родитель. Так воркеру
+пула не нужна база, а страницы с заглушкой сбрасываются из кэша сразу,
+как только миниатюры готовы.
+
+Карточки страницы ищут свои миниатюры в kvstore разом (prefetch): один
+get_many к кэшу и не больше одного запроса к базе вместо пары обращений
+на каждую картинку.
+
+У каждого алиаса есть варианты (variants): меньшие ширины из
+POST_THUMBNAIL_WIDTHS и копии в форматах POST_THUMBNAIL_FORMATS. Из них
+responsive() собирает srcset, и телефон не качает картинку для экрана
+ноутбука.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from sorl.thumbnail.parsers import parse_geometry
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+# Сколько миниатюр нашёл prefetch, сколько обращений к kvstore он
+# сделал и сколько сэкономил по сравнению с поштучным поиском.
+lookup_stats = Counter()
+
+
+Variant = namedtuple('Variant', 'alias width format geometry options')
+
+
+class Placeholder:
+    """Заглушка на месте ещё не готовой миниатюры: её размеры и, если
+    посчитаны, основной цвет и превью картинки."""
+
+    url = None
+    complete = False
+
+    def __init__(self, geometry, color='', preview=''):
+        self.width, self.height = parse_geometry(geometry)
+        self.color, self.preview = color, preview
+
+
+class Responsive:
+    """Миниатюра с вариантами для <picture>: srcset в формате исходника
+    и sources — пары (MIME-тип, srcset) для остальных форматов."""
+
+    def __init__(self, thumbnail, srcsets, complete, color='', preview=''):
+        self.url = thumbnail.url
+        self.color, self.preview = color, preview
+        self.width, self.height = thumbnail.width, thumbnail.height
+        self.srcset = srcsets.pop(None, '')
+        self.sources = [(Image.MIME[image_format], srcset)
+                        for image_format, srcset in srcsets.items()]
+        # Готовы не все варианты: такую картинку не стоит кэшировать.
+        self.complete = complete
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, у которого имя миниатюры можно узнать, не создавая
+    её, а создание отделено от записи в kvstore."""
+
+    def thumbnail_file(self, source, geometry, options):
+        """Миниатюра source с теми же опциями и именем файла, что дал бы
+        get_thumbnail."""
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry, options)
+        return ImageFile(name, default.storage), options
+
+    def render(self, source, source_image, geometry, options):
+        """Создаёт файл миниатюры из уже открытого исходника; возвращает
+        размеры исходника, имя и размеры миниатюры."""
+        thumbnail, options = self.thumbnail_file(source, geometry, options)
+        if not thumbnail.exists():
+            options['image_info'] = default.engine.get_image_info(
+                source_image)
+            self._create_thumbnail(source_image, geometry, options, thumbnail)
+            self._create_alternative_resolutions(
+                source_image, geometry, options, thumbnail.name)
+        thumbnail.set_size()
+        return source.size, thumbnail.name, thumbnail.size
+
+
+backend = PostThumbnailBackend()
+
+
+def _scaled(geometry, width):
+    base_width, base_height = parse_geometry(geometry)
+    if base_height is None:
+        return str(width)
+    return f'{width}x{round(base_height * width / base_width)}'
+
+
+def variants(alias=None):
+    """Варианты миниатюр алиаса (или всех алиасов) по именам.
+
+    Сам алиас — исходная геометрия в формате картинки. К нему
+    добавляются alias@ширина для меньших ширин из POST_THUMBNAIL_WIDTHS
+    и alias@ширина.формат для форматов POST_THUMBNAIL_FORMATS, которые
+    умеет писать установленный Pillow.
+    """
+    Image.init()
+    formats = [None] + [image_format
+                        for image_format in settings.POST_THUMBNAIL_FORMATS
+                        if image_format in Image.SAVE]
+    result = OrderedDict()
+    for name, (geometry, options) in settings.POST_THUMBNAILS.items():
+        if alias not in (None, name):
+            continue
+        width = parse_geometry(geometry)[0]
+        widths = sorted(
+            {smaller for smaller in settings.POST_THUMBNAIL_WIDTHS
+             if width and smaller < width}) + [width]
+        for image_format in formats:
+            for smaller in widths:
+                key = name if smaller == width else f'{name}@{smaller}'
+                variant_options = options
+                if image_format:
+                    key = f'{name}@{smaller}.{image_format.lower()}'
+                    variant_options = dict(options, format=image_format)
+                result[key] = Variant(
+                    name, smaller, image_format,
+                    _scaled(geometry, smaller) if smaller != width
+                    else geometry, variant_options)
+    return result
+
+
+def geometries():
+    """Пары (геометрия, опции) всех вариантов — задание для render_all."""
+    return [(variant.geometry, variant.options)
+            for variant in variants().values()]
+
+
+def _thumbnail_file(image, variant):
+    variant = variants()[variant]
+    geometry, options = variant.geometry, variant.options
+    # Исходник всегда открываем по имени через хранилище sorl: ключ
+    # kvstore зависит от класса хранилища, а у поля оно своё.
+    name = getattr(image, 'name', image)
+    return backend.thumbnail_file(ImageFile(name), geometry, options)[0]
+
+
+def thumbnail_names(name):
+    """Имена файлов всех миниатюр картинки name, включая варианты
+    THUMBNAIL_ALTERNATIVE_RESOLUTIONS."""
+    names = set()
+    for variant in variants():
+        thumbnail = _thumbnail_file(name, variant).name
+        names.add(thumbnail)
+        stem, extension = os.path.splitext(thumbnail)
+        for resolution in sorl_settings.THUMBNAIL_ALTERNATIVE_RESOLUTIONS:
+            names.add(f'{stem}@{resolution}x{extension}')
+    return names
+
+
+def _lookup(image, variant):
+    prefetched = getattr(image.instance, '_prefetched_thumbnails', {})
+    if variant in prefetched:
+        return prefetched[variant]
+    return default.kvstore.get(_thumbnail_file(image, variant))
+
+
+def get(image, alias):
+    """Готовая миниатюра, заглушка или None, если картинки нет.
+
+    Не найдя миниатюру, ставит картинку в очередь: она могла не
+    попасть в пул при сохранении (очередь была полна, процесс умер).
+    """
+    if not image:
+        return None
+    thumbnail = _lookup(image, alias)
+    if thumbnail is not None:
+        return thumbnail
+    transaction.on_commit(partial(schedule, image))
+    return Placeholder(settings.POST_THUMBNAILS[alias][0], *_preview(image))
+
+
+def _preview(image):
+    post = image.instance
+    return (getattr(post, 'image_color', ''),
+            getattr(post, 'image_preview', ''))
+
+
+def responsive(image, alias='card'):
+    """Как get(), но с вариантами для srcset: Responsive, заглушка или
+    None. Недостающие варианты ставятся в очередь, готовые уже идут
+    в srcset."""
+    thumbnail = get(image, alias)
+    if thumbnail is None or isinstance(thumbnail, Placeholder):
+        return thumbnail
+    srcsets, complete = {}, True
+    for name, variant in variants(alias).items():
+        found = _lookup(image, name)
+        if found is None:
+            complete = False
+            continue
+        srcsets.setdefault(variant.format, []).append(
+            f'{found.url} {found.width}w')
+    if not complete:
+        transaction.on_commit(partial(schedule, image))
+    return Responsive(
+        thumbnail, {image_format: ', '.join(srcset)
+                    for image_format, srcset in srcsets.items()}, complete,
+        *_preview(image))
+
+
+def _get_many_raw(keys):
+    """Значения kvstore sorl по ключам и число промахов кэша.
+
+    Повторяет KVStore._get_raw из cached_db_kvstore, но пачкой: сначала
+    кэш, затем промахи одним запросом к базе. Отсутствие записи тоже
+    кэшируется, как это делает sorl.
+    """
+    kvstore = default.kvstore
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        fetched = {key: found.get(key, cached_db_kvstore.EMPTY_VALUE)
+                   for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return values, len(missing)
+
+
+def prefetch(posts, alias='card'):
+    """Находит готовые миниатюры картинок постов (все варианты алиаса)
+    одним заходом в kvstore.
+
+    Результат запоминается на постах, и get() с responsive() для них
+    в хранилище уже не ходят. Возвращает число сэкономленных обращений.
+    """
+    lookups = {
+        add_prefix(_thumbnail_file(post.image, variant).key): (post, variant)
+        for post in posts if post.image for variant in variants(alias)}
+    # Пачкой умеем читать только kvstore sorl по умолчанию; с другими
+    # get() ищет миниатюры по одной, как раньше.
+    if not lookups or not isinstance(
+            default.kvstore, cached_db_kvstore.KVStore):
+        return 0
+    values, misses = _get_many_raw(list(lookups))
+    for key, (post, variant) in lookups.items():
+        value = values[key]
+        if value == cached_db_kvstore.EMPTY_VALUE:
+            value = None
+        post.__dict__.setdefault('_prefetched_thumbnails', {})[variant] = (
+            deserialize_image_file(value) if value else None)
+    # Поштучно было бы обращение к кэшу на миниатюру и к базе на промах.
+    round_trips = 1 + bool(misses)
+    saved = len(lookups) + misses - round_trips
+    lookup_stats.update(
+        thumbnails=len(lookups), round_trips=round_trips, saved=saved)
+    logger.debug('Миниатюр на странице: %d, обращений к kvstore: %d, '
+                 'сэкономлено: %d', len(lookups), round_trips, saved)
+    return saved
+
+
+def missing(posts):
+    """Посты с картинкой, у которой готовы не все миниатюры."""
+    for alias in settings.POST_THUMBNAILS:
+        prefetch(posts, alias)
+    return [post for post in posts if post.image and not all(
+        _lookup(post.image, variant) for variant in variants())]
+
+
+def post_scopes(post):
+    """Области кэша страниц, где показывается картинка поста."""
+    scopes = [f'post:{post.pk}', cache.FEED, f'author:{post.author.username}']
+    if post.group_id:
+        scopes.append(f'group:{post.group.slug}')
+    return scopes
+
+
+def render_all(name, thumbnails):
+    """Создаёт файлы миниатюр thumbnails — пар (геометрия, опции).
+
+    Выполняется в процессе пула и в базу не ходит; результат передают
+    в register(). Исходник декодируется один раз на все варианты. Пока
+    задача ждала очереди, картинку могли заменить или удалить вместе
+    с постом — это не ошибка.
+    """
+    source = ImageFile(name)
+    if not source.exists():
+        return []
+    source_image = default.engine.get_image(source)
+    try:
+        source.set_size(default.engine.get_image_size(source_image))
+        return [backend.render(source, source_image, geometry, options)
+                for geometry, options in thumbnails]
+    finally:
+        default.engine.cleanup(source_image)
+
+
+def register(name, results):
+    """Записывает в kvstore миниатюры, созданные render_all()."""
+    source = ImageFile(name)
+    for source_size, thumbnail_name, size in results:
+        source.set_size(source_size)
+        default.kvstore.get_or_set(source)
+        thumbnail = ImageFile(thumbnail_name, default.storage)
+        thumbnail.set_size(size)
+        default.kvstore.set(thumbnail, source)
+
+
+def generate(image):
+    """Нарезает миниатюры картинки здесь же, без пула."""
+    register(image.name, render_all(image.name, geometries()))
+
+
+def _init_worker():
+    # Так же поступает параллельный тест-раннер Django: соединения,
+    # унаследованные при fork, ребёнку не принадлежат.
+    connections.close_all()
+
+
+def make_executor(workers, start_method='fork'):
+    """Пул процессов для render_all.
+
+    fork годится для однопоточной команды: ребёнок наследует настроенный
+    Django, django.setup() в нём не нужен. Веб-воркер многопоточен и
+    держит открытые соединения с базой и кэшем — копировать такой
+    процесс посреди запроса небезопасно, поэтому там spawn: ребёнок
+    начинает с чистого интерпретатора и настраивает Django сам
+    (DJANGO_SETTINGS_MODULE он получает в окружении). Инициализатор —
+    сам django.setup: ссылку на функцию из этого модуля ребёнок не смог
+    бы развернуть до настройки приложений.
+    """
+    initializer = django.setup if start_method == 'spawn' else _init_worker
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=initializer)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = make_executor(
+                settings.POST_THUMBNAIL_WORKERS, 'spawn')
+    return _executor
+
+
+def schedule(image):
+    """Ставит нарезку миниатюр картинки поста в пул процессов.
+
+    Очередь ограничена POST_THUMBNAIL_QUEUE: при переполнении картинка
+    пропускается, и её поставит в очередь первый же показ заглушки.
+    Возвращает True, если задача поставлена.
+    """
+    if not image or all(
+            default.kvstore.get(_thumbnail_file(image, variant))
+            for variant in variants()):
+        return False
+    with _lock:
+        if (image.name in _pending
+                or len(_pending) >= settings.POST_THUMBNAIL_QUEUE):
+            return False
+        _pending.add(image.name)
+    future = _get_executor().submit(
+        render_all, image.name, geometries())
+    # Сохранение поста сбросило главную до того, как миниатюры готовы:
+    # её снова сбрасывает _finished, иначе там залежится заглушка.
+    future.add_done_callback(partial(
+        _finished, image.name, post_scopes(image.instance),
+        threading.get_ident()))
+    return True
+
+
+def _finished(name, scopes, caller, future):
+    try:
+        results = future.result()
+    except Exception:
+        logger.exception('Не удалось нарезать миниатюры %s', name)
+        return
+    finally:
+        with _lock:
+            _pending.discard(name)
+    if not results:
+        return
+    try:
+        register(name, results)
+        cache.bump(*scopes)
+    finally:
+        # Колбэк обычно зовёт служебный поток пула, и его соединение
+        # с базой больше никому не нужно.
+        if threading.get_ident() != caller:
+            connections.close_all()
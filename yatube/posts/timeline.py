@@ -0,0 +1,252 @@
+"""Лента подписок: push для обычных авторов, pull для популярных.
+
+Посты авторов, у которых подписчиков не больше
+settings.FEED_FANOUT_MAX_FOLLOWERS, раскладываются по TimelineEntry
+подписчиков при публикации. Посты более популярных авторов в ленты не
+пишутся: их подмешивает HybridFeed при чтении, иначе один пост
+превращался бы в сотни тысяч вставок.
+
+Автор переходит на pull, когда подписчиков становится больше
+FEED_FANOUT_MAX_FOLLOWERS, а обратно — только когда их остаётся
+FEED_FANOUT_MIN_FOLLOWERS: автор, у которого число подписчиков колеблется
+около порога, не переключается туда-сюда. При возврате посты, вышедшие
+за время pull (PulledAuthor.since), раскладываются подписчикам в фоновом
+потоке после коммита, а не в запросе отписавшегося.
+"""
+import heapq
+import logging
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import counters
+from .models import Counter, Follow, Post, PulledAuthor, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+
+
+def push_limit():
+    """Сколько подписчиков должно остаться у автора на pull, чтобы его
+    посты снова раскладывались по лентам."""
+    return getattr(settings, 'FEED_FANOUT_MIN_FOLLOWERS',
+                   fanout_limit() * 4 // 5)
+
+
+def pulled_since(author_id):
+    """С какого момента посты автора читаются через pull; None, если
+    они раскладываются по лентам."""
+    return PulledAuthor.objects.filter(author_id=author_id).values_list(
+        'since', flat=True).first()
+
+
+def is_pulled(author_id):
+    """Автор слишком популярен, чтобы раскладывать его посты по лентам."""
+    return pulled_since(author_id) is not None
+
+
+def _insert(entries):
+    # bulk_create сначала превращает аргумент в список, поэтому режем
+    # генератор сами: память не растёт с числом подписчиков.
+    entries = iter(entries)
+    batch = list(islice(entries, BATCH_SIZE))
+    while batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, BATCH_SIZE))
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=post.pk,
+                      author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers.iterator())
+
+
+def _backfill(user_id, posts):
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=pk,
+                      author_id=author_id, pub_date=pub_date)
+        for pk, author_id, pub_date in posts.values_list(
+            'pk', 'author_id', 'pub_date').iterator())
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту нового подписчика посты автора. У автора на
+    pull — только вышедшие до перехода: остальные подмешает HybridFeed,
+    а при возврате к push разложит demote()."""
+    posts = Post.objects.filter(author_id=author_id)
+    since = pulled_since(author_id)
+    if since is not None:
+        posts = posts.filter(pub_date__lt=since)
+    _backfill(user_id, posts)
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id).delete()
+
+
+def promote(author_id, followers):
+    """Переводит автора на pull, если подписчиков стало больше
+    FEED_FANOUT_MAX_FOLLOWERS."""
+    if followers > fanout_limit():
+        PulledAuthor.objects.get_or_create(
+            author_id=author_id, defaults={'since': timezone.now()})
+
+
+def push_window(author_id, since):
+    """Раскладывает подписчикам посты автора, вышедшие начиная с since."""
+    posts = Post.objects.filter(author_id=author_id, pub_date__gte=since)
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    for user_id in followers.iterator():
+        _backfill(user_id, posts)
+
+
+def demote(author_id):
+    """Возвращает автора с pull на push.
+
+    Пока посты окна раскладываются, автор остаётся на pull и ленты
+    полны. Посты, вышедшие за это время, догоняет второй, короткий
+    проход после снятия отметки.
+    """
+    since = pulled_since(author_id)
+    followers = counters.get_count(Counter.AUTHOR_FOLLOWERS, author_id)
+    if since is None or followers > push_limit():
+        return
+    started = timezone.now()
+    push_window(author_id, since)
+    PulledAuthor.objects.filter(author_id=author_id).delete()
+    push_window(author_id, started)
+
+
+def _demote_in_background(author_id):
+    def run():
+        try:
+            demote(author_id)
+        except Exception:
+            logger.exception('Не удалось вернуть автора %s на push',
+                             author_id)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def schedule_demote(author_id, followers):
+    """Ставит возврат на push после коммита, когда у автора на pull
+    осталось FEED_FANOUT_MIN_FOLLOWERS подписчиков. Порог проверяется
+    на равенство: отписки уменьшают счётчик по одному, и каждое
+    пересечение порога вниз запускает возврат один раз."""
+    if followers == push_limit() and is_pulled(author_id):
+        transaction.on_commit(
+            lambda: _demote_in_background(author_id))
+
+
+class HybridFeed:
+    """Слияние записей ленты пользователя с постами популярных авторов.
+
+    Поддерживает ровно то подмножество API QuerySet, которым пользуется
+    CursorPaginator: order_by/filter/reverse применяются к обоим
+    источникам, срез читает не больше stop строк из каждого и сливает
+    их по (pub_date, post_id). Посты популярных авторов отдаются
+    несохранёнными TimelineEntry, чтобы вьюхе было всё равно, откуда
+    пришла запись. Дубли (пост успели разложить до того, как автор
+    перешёл порог) отбрасываются.
+    """
+
+    ordered = True
+
+    def __init__(self, entries, pulled, descending=True,
+                 start=0, stop=None):
+        self.entries = entries
+        self.pulled = pulled
+        self.descending = descending
+        self.start, self.stop = start, stop
+
+    def _clone(self, entries, pulled, **kwargs):
+        options = {'descending': self.descending,
+                   'start': self.start, 'stop': self.stop}
+        options.update(kwargs)
+        return HybridFeed(entries, pulled, **options)
+
+    def order_by(self, *fields):
+        return self._clone(
+            self.entries.order_by(*fields), self.pulled.order_by(*fields),
+            descending=fields[0].startswith('-'))
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self.entries.filter(*args, **kwargs),
+                           self.pulled.filter(*args, **kwargs))
+
+    def reverse(self):
+        return self._clone(self.entries.reverse(), self.pulled.reverse(),
+                           descending=not self.descending)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._clone(self.entries, self.pulled,
+                               start=key.start or 0, stop=key.stop)
+        return list(self)[key]
+
+    def _merged(self):
+        entries, pulled = self.entries, self.pulled
+        if self.stop is not None:
+            entries, pulled = entries[:self.stop], pulled[:self.stop]
+        pulled = (
+            TimelineEntry(post=post, author_id=post.author_id,
+                          pub_date=post.pub_date)
+            for post in pulled)
+        seen = set()
+        for entry in heapq.merge(
+                entries, pulled, reverse=self.descending,
+                key=lambda entry: (entry.pub_date, entry.post_id)):
+            if entry.post_id not in seen:
+                seen.add(entry.post_id)
+                yield entry
+
+    def __iter__(self):
+        return islice(self._merged(), self.start, self.stop)
+
+    def count(self):
+        return sum(1 for _ in self)
+
+    def __len__(self):
+        return self.count()
+
+
+def follow_feed(user, followed):
+    """Лента подписок пользователя в виде, пригодном для пагинатора.
+
+    followed — id авторов, на которых он подписан.
+    """
+    entries = TimelineEntry.objects.filter(
+        user=user).select_related('post__author', 'post__group')
+    if not followed:
+        return entries
+    pulled_ids = list(PulledAuthor.objects.filter(
+        author_id__in=list(followed)).values_list('author_id', flat=True))
+    if not pulled_ids:
+        return entries
+    # Аннотация post_id даёт постам те же имена полей, что у записей
+    # ленты, и фильтры курсора применяются к обоим источникам как есть.
+    pulled = Post.objects.filter(author_id__in=pulled_ids).annotate(
+        post_id=F('id')).select_related('author', 'group')
+    return HybridFeed(entries, pulled)
@@ -0,0 +1,193 @@
+"""Нормализация картинок постов при загрузке.
+
+Фотография с телефона весит десятки мегабайт, и каждый промах миниатюры
+заново читал бы и декодировал её целиком. Поэтому PostForm до
+сохранения уменьшает картинку до POST_IMAGE_MAX_SIZE, поворачивает по
+EXIF и выбрасывает метаданные (вместе с ними — координаты съёмки) и
+пережимает с качеством POST_IMAGE_QUALITY. POST_IMAGE_NORMALIZE = False
+выключает обработку.
+
+Память ограничена: JPEG декодируется сразу в уменьшенном масштабе
+(Image.draft), а результат пишется во временный файл, который уходит
+на диск, если больше FILE_UPLOAD_MAX_MEMORY_SIZE.
+
+До всякого декодирования check() смотрит только заголовок: формат,
+размеры и число пикселей. PostForm зовёт его раньше, чем поле картинки
+само откроет файл (checked). Так PNG 50000×50000 в пару килобайт
+(«декомпрессионная бомба») отбивается, не заняв память воркера. Сама
+загрузка больше FILE_UPLOAD_MAX_MEMORY_SIZE пишется во временный файл
+(LimitedTemporaryFileUploadHandler), но не дальше
+POST_IMAGE_MAX_UPLOAD_SIZE.
+
+Тут же считается заглушка для карточки (preview): основной цвет и
+размытая копия в несколько десятков пикселей в виде data: URI. Она
+хранится в посте и встраивается прямо в HTML страницы.
+"""
+import base64
+import logging
+import tempfile
+import warnings
+from collections import Counter
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageFilter, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Форматы, которые пережимаем; остальное (анимация, TIFF, BMP)
+# сохраняется как есть.
+FORMATS = {
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'method': 6},
+    'GIF': {'optimize': True},
+}
+LOSSY = ('JPEG', 'WEBP')
+METADATA = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+
+# Сколько картинок обработано и сколько байт сэкономлено.
+stats = Counter()
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, но не больше
+    POST_IMAGE_MAX_UPLOAD_SIZE байт: остаток отбрасывается, а файл
+    помечается oversized, и check() его отклоняет."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received <= settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.oversized = self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE
+        return file
+
+
+def check(upload):
+    """Проверяет картинку по заголовку, не декодируя её: размер файла,
+    формат из POST_IMAGE_FORMATS, стороны и число пикселей."""
+    max_size = settings.POST_IMAGE_MAX_UPLOAD_SIZE
+    formats = settings.POST_IMAGE_FORMATS
+    if getattr(upload, 'oversized', False) or upload.size > max_size:
+        raise ValidationError(
+            'Файл больше %(size)s.', code='file_too_large',
+            params={'size': filesizeformat(max_size)})
+    upload.seek(0)
+    try:
+        # Image.open читает только заголовок. Свою проверку бомб Pillow
+        # делает тут же, а её предупреждение превращаем в ошибку.
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            with Image.open(upload, formats=formats) as image:
+                width, height = image.size
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        width = height = float('inf')
+    except (OSError, ValueError):
+        raise ValidationError(
+            'Поддерживаются картинки %(formats)s.', code='invalid_format',
+            params={'formats': ', '.join(formats)})
+    finally:
+        upload.seek(0)
+    if (max(width, height) > settings.POST_IMAGE_MAX_DIMENSION
+            or width * height > settings.POST_IMAGE_MAX_PIXELS):
+        raise ValidationError(
+            'Картинка больше %(pixels)d мегапикселей или длиннее '
+            '%(dimension)d точек по стороне.', code='too_many_pixels',
+            params={'pixels': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6,
+                    'dimension': settings.POST_IMAGE_MAX_DIMENSION})
+
+
+def checked(to_python, data):
+    """Вызов to_python поля картинки, перед которым загрузка проверена
+    check(): так бомба получает свою ошибку, а не «повреждённый файл»
+    после попытки её открыть."""
+    if isinstance(data, UploadedFile):
+        check(data)
+    return to_python(data)
+
+
+def _encode(image, image_format, icc_profile):
+    options = dict(FORMATS[image_format])
+    if image_format in LOSSY:
+        options['quality'] = settings.POST_IMAGE_QUALITY
+    if icc_profile:
+        # Без профиля цвета фотографий с широким охватом поблекнут.
+        options['icc_profile'] = icc_profile
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, image_format, **options)
+    return output
+
+
+def normalize(upload):
+    """Уменьшенная и очищенная копия загруженной картинки.
+
+    Возвращает upload без изменений, если формат не поддерживается или
+    обработка ничего не дала: картинка и так мала, метаданных нет,
+    а пережатый файл не меньше исходного.
+    """
+    if not settings.POST_IMAGE_NORMALIZE:
+        return upload
+    upload.seek(0)
+    image = Image.open(upload)
+    if image.format not in FORMATS or getattr(image, 'n_frames', 1) > 1:
+        return upload
+    image_format = image.format
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    original_size = image.size
+    has_metadata = any(key in image.info for key in METADATA)
+    icc_profile = image.info.get('icc_profile')
+    # Декодер JPEG сам уменьшает картинку в 2–8 раз: полноразмерный
+    # растр в память не попадает.
+    image.draft(image.mode, max_size)
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size, Image.LANCZOS)
+    # Кодировщики PNG и WebP берут EXIF из image.info, если его не
+    # передали явно; прозрачность и прочее в info остаются.
+    for key in METADATA:
+        image.info.pop(key, None)
+    resized = image.size != original_size
+    output = _encode(image, image_format, icc_profile)
+    size = output.tell()
+    if not (resized or has_metadata) and size >= upload.size:
+        output.close()
+        return upload
+    stats.update(images=1, bytes_in=upload.size, bytes_out=size,
+                 saved=upload.size - size)
+    logger.info('Картинка %s: %dx%d → %dx%d, %d → %d байт',
+                upload.name, *original_size, *image.size, upload.size, size)
+    output.seek(0)
+    return UploadedFile(output, upload.name, upload.content_type, size)
+
+
+def preview(file):
+    """Основной цвет (#rrggbb) и data: URI размытой копии картинки
+    не больше POST_IMAGE_PREVIEW_SIZE пикселей по стороне."""
+    size = settings.POST_IMAGE_PREVIEW_SIZE
+    file.seek(0)
+    with Image.open(file) as image:
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    file.seek(0)
+    image.thumbnail((size, size), Image.LANCZOS)
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    # Основной цвет — самый частый из четырёх после квантования.
+    palette = image.quantize(colors=4).convert('RGB')
+    color = max(palette.getcolors())[1]
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=50)
+    data = base64.b64encode(buffer.getvalue()).decode()
+    return '#%02x%02x%02x' % color, f'data:image/jpeg;base64,{data}'
@@ -1,33 +1,41 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Post, Group, User, Comment, Follow
-from django.core.paginator import Paginator
+from .models import Post, Group, User, Comment, Counter, Follow
 from .forms import PostForm, CommentForm
+from .paginator import paginate
+from . import counters, search, timeline
+from .cache import cache_feed_page
+from .conditional import conditional_page, feed_scopes, post_scopes
+from .following import following_ids, is_following
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 
 
 PAGE_PER_LIST = 10
 
 
 #  Главная страница
-@cache_page(20)
+@conditional_page(feed_scopes())
+@cache_feed_page()
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, PAGE_PER_LIST)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.select_related('author', 'group')
+    page_obj = paginate(request, post_list, PAGE_PER_LIST,
+                        count=counters.get_count(Counter.TOTAL_POSTS))
+    if page_obj is None:
+        return redirect('posts:index')
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(feed_scopes('group:{slug}'))
+@cache_feed_page('group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
-    paginator = Paginator(posts, PAGE_PER_LIST)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = group.posts.select_related('author')
+    post_count = counters.get_count(Counter.GROUP_POSTS, group.pk)
+    page_obj = paginate(request, posts, PAGE_PER_LIST, count=post_count)
+    if page_obj is None:
+        return redirect('posts:group_name', slug=slug)
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -35,15 +43,16 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(feed_scopes('author:{username}'))
+@cache_feed_page('author:{username}')
 def profile(request, username):
     profile_name = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=profile_name)
-    post_count = posts.count()
-    paginator = Paginator(posts, PAGE_PER_LIST)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=profile_name).exists()
+    posts = profile_name.posts.select_related('group')
+    post_count = counters.get_count(Counter.AUTHOR_POSTS, profile_name.pk)
+    page_obj = paginate(request, posts, PAGE_PER_LIST, count=post_count)
+    if page_obj is None:
+        return redirect('posts:profile', username=username)
+    following = is_following(request.user, profile_name)
     context = {
         'page_obj': page_obj,
         'profile_name': profile_name,
@@ -53,9 +62,11 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(post_scopes)
 def post_detail(request, post_id):
     post_number = get_object_or_404(Post, pk=post_id)
-    post_count = Post.objects.filter(author=post_number.author).count()
+    post_count = counters.get_count(
+        Counter.AUTHOR_POSTS, post_number.author_id)
     post_title = post_number.text[:30]
     comments = Comment.objects.filter(post_id=post_id)
     form = CommentForm(request.POST or None)
@@ -69,9 +80,25 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    posts, has_next = search.search(query, page, PAGE_PER_LIST)
+    context = {
+        'query': query,
+        'posts': posts,
+        'page': page,
+        'has_next': has_next,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
@@ -132,11 +159,13 @@ def profile_unfollow(request, username):
 
 @login_required
 def follow_index(request):
-    authors_ids = Follow.objects.filter(
-        user=request.user).values_list('author', flat=True)
-    posts = Post.objects.filter(author__in=authors_ids)
-    paginator = Paginator(posts, PAGE_PER_LIST)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    authors_ids = following_ids(request.user)
+    entries = timeline.follow_feed(request.user, authors_ids)
+    post_count = counters.get_total(Counter.AUTHOR_POSTS, authors_ids)
+    page_obj = paginate(request, entries, PAGE_PER_LIST, count=post_count,
+                        ordering=('pub_date', 'post_id'))
+    if page_obj is None:
+        return redirect('posts:follow_index')
+    page_obj.object_list = [entry.post for entry in page_obj]
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
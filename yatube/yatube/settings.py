@@ -137,8 +137,91 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Отдача медиа (core.media). Раздаются только каталоги картинок постов
+# и миниатюр sorl. MEDIA_SENDFILE: None — файл стримит Django,
+# 'x-accel-redirect' — nginx (internal-location с alias на MEDIA_ROOT
+# по адресу MEDIA_ACCEL_REDIRECT_PREFIX), 'x-sendfile' — Apache/lighttpd.
+MEDIA_SERVE_PREFIXES = ('posts/', 'cache/')
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Один файл на хост: кэш и его инвалидация общие для всех воркеров.
+# Лежит в var/ вне исходников (каталог в .gitignore).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'var', 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
     }
 }
+# Тесты подменяют его на LocMemCache, чтобы не стереть кэш сервера.
+TEST_RUNNER = 'core.test_runner.LocalCacheRunner'
+
+# Посты авторов, у которых подписчиков больше этого числа, не
+# раскладываются по лентам подписчиков, а подмешиваются при чтении.
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+# Обратно на раскладку автор возвращается, когда подписчиков остаётся
+# столько: между порогами режим не меняется (posts.timeline).
+FEED_FANOUT_MIN_FOLLOWERS = 8000
+
+# Сколько пользователей держит в памяти кэш подписок (posts.following)
+# и сколько секунд живёт запись, даже если версия подписок не менялась.
+FOLLOWING_CACHE_SIZE = 10000
+FOLLOWING_CACHE_TIMEOUT = 60
+
+# Страницы лент сбрасываются сигналами при изменении данных (posts.cache),
+# поэтому живут в кэше долго.
+FEED_CACHE_TIMEOUT = 60 * 60
+# Сколько ещё после FEED_CACHE_TIMEOUT истёкшая страница отдаётся сразу,
+# пока новая строится в фоне.
+FEED_CACHE_STALE = 60 * 10
+# Защита от «стада» при промахе (posts.cache.cache_page_coalesced):
+# сколько держится блокировка пересчёта, сколько остальные ждут готовую
+# страницу и насколько охотно запись обновляется до истечения (XFetch).
+FEED_CACHE_LOCK_TIMEOUT = 10
+FEED_CACHE_WAIT = 2
+FEED_CACHE_BETA = 1.0
+
+# Отрисованные карточки постов (posts.templatetags.post_cards). Ключ
+# меняется вместе с содержимым карточки, так что TTL нужен лишь для
+# вытеснения.
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Миниатюры картинок постов (posts.thumbnails): алиас -> (геометрия, опции
+# sorl). Режутся после сохранения поста в пуле из POST_THUMBNAIL_WORKERS
+# процессов; в очереди ждут не больше POST_THUMBNAIL_QUEUE картинок.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Кроме того, для srcset режутся меньшие ширины POST_THUMBNAIL_WIDTHS
+# с теми же пропорциями и копии всех вариантов в POST_THUMBNAIL_FORMATS
+# (если установленный Pillow умеет их писать).
+POST_THUMBNAIL_WIDTHS = (320, 480, 720)
+POST_THUMBNAIL_FORMATS = ('WEBP',)
+POST_THUMBNAIL_WORKERS = 2
+POST_THUMBNAIL_QUEUE = 100
+
+# Обработка картинок постов при загрузке (posts.uploads): уменьшение до
+# POST_IMAGE_MAX_SIZE, удаление EXIF и пережатие JPEG/WebP с качеством
+# POST_IMAGE_QUALITY.
+POST_IMAGE_NORMALIZE = True
+POST_IMAGE_MAX_SIZE = (2560, 2560)
+POST_IMAGE_QUALITY = 85
+# Проверка загрузки по заголовку (posts.uploads.check) до декодирования.
+POST_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_DIMENSION = 10000
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+# Загрузки больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся во временный файл,
+# а не держатся в памяти; на диск — не больше POST_IMAGE_MAX_UPLOAD_SIZE.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'posts.uploads.LimitedTemporaryFileUploadHandler',
+]
+# Сторона размытого превью, которое встраивается в карточку (пиксели).
+POST_IMAGE_PREVIEW_SIZE = 16